@@ -1,62 +1,362 @@
-from fastapi import FastAPI, UploadFile, File
-import shutil, os
+from fastapi import FastAPI, UploadFile, File, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+import asyncio
+import os
 import uvicorn
-from typing import List
+from typing import List, Optional
+
+from backend import cache, metrics
+from backend.captions import CaptionHub
+from backend.jobs import JobManager, QueueFull
 
 app = FastAPI(title="SonicLens Backend")
+# the web demo is opened from file:// or another port
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+captions = CaptionHub()
+_live = None  # LiveTranscriber while /live is running
+
+@app.on_event("startup")
+async def _bind_caption_hub():
+    captions.bind(asyncio.get_running_loop())
+
+@app.on_event("startup")
+async def _preload_models():
+    # SONICLENS_PRELOAD=whisper:small,summarizer,... so the first request doesn't pay for loading
+    from backend.models import preload_from_env
+    await run_in_threadpool(preload_from_env)
+
+# uploads are decoded in memory (backend.audio.decode_stream); nothing is stored under data/
+UPLOAD_MAX_BYTES = int(float(os.environ.get("SONICLENS_UPLOAD_MAX_MB", "512")) * 1024 * 1024)
+UPLOAD_MAX_SEC = float(os.environ.get("SONICLENS_UPLOAD_MAX_SEC", str(4 * 3600)))
+
+# clips up to this long are answered inline (in a worker thread); longer ones become jobs
+SYNC_MAX_SEC = float(os.environ.get("SONICLENS_SYNC_MAX_SEC", "60"))
+
+# /actions/ transcripts up to this many summarizer chunks are answered inline; longer ones become jobs
+ACTIONS_SYNC_MAX_CHUNKS = int(os.environ.get("SONICLENS_ACTIONS_SYNC_CHUNKS", "4"))
+
+jobs = JobManager()
 
-UPLOAD_DIR = "data/samples"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+def _register_gauges():
+    from backend.models import registry as models
+    metrics.registry.gauge("soniclens_job_queue_depth", lambda: jobs.depth, "Jobs queued or running")
+    metrics.registry.gauge("soniclens_result_cache_hits", lambda: cache.results.hits, "Result cache hits")
+    metrics.registry.gauge("soniclens_result_cache_misses", lambda: cache.results.misses, "Result cache misses")
+    metrics.registry.gauge("soniclens_model_cache_hits", lambda: models.hits, "Model registry hits")
+    metrics.registry.gauge("soniclens_model_cache_misses", lambda: models.misses, "Model registry misses (loads)")
+    metrics.registry.gauge("soniclens_model_evictions", lambda: models.evictions, "Models evicted for the memory budget")
+    metrics.registry.gauge("soniclens_model_resident_bytes", lambda: models.stats()["resident"], "Estimated bytes per resident model", label="model")
+    metrics.registry.gauge("soniclens_caption_subscribers", lambda: captions.subscribers, "Connected caption clients")
+
+_register_gauges()
 
 @app.get("/")
 def root():
     return {"message": "SonicLens Backend Running 🚀"}
 
-@app.post("/transcribe/")
-async def transcribe(file: UploadFile = File(...)):
+def _read_upload(file: UploadFile):
     """
-    Upload audio file -> run ASR (whisper wrapper) if available -> return transcript.
+    Decode the upload stream straight to 16 kHz mono PCM: held in memory, spilled to a
+    private temp file only past SONICLENS_UPLOAD_SPOOL_MB, never written under data/.
+    The returned AudioSource is handed to VAD/ASR as is; whoever ends up owning it
+    (the request, or the job's cleanup) closes it. 413 over UPLOAD_MAX_BYTES /
+    UPLOAD_MAX_SEC, 415 when the upload isn't decodable audio, 503 when decoding it
+    needs ffmpeg and the server has none.
     """
-    file_path = os.path.join(UPLOAD_DIR, file.filename)
-    with open(file_path, "wb") as f:
-        shutil.copyfileobj(file.file, f)
+    from backend.audio import AudioTooLarge, DecoderUnavailable, decode_stream
+    if file.size is not None and file.size > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"upload is over {UPLOAD_MAX_BYTES} bytes")
+    try:
+        with metrics.span("upload"):
+            return decode_stream(file.file, max_bytes=UPLOAD_MAX_BYTES, max_sec=UPLOAD_MAX_SEC,
+                                 name=file.filename or "<upload>")
+    except AudioTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except DecoderUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=415, detail=str(e))
 
+def _reserve_slot():
+    try:
+        jobs.reserve()
+    except QueueFull:
+        raise HTTPException(status_code=429, detail="job queue is full, retry later")
+
+async def _admit_upload(file: UploadFile, queued: bool = False):
+    """
+    Decode the upload, holding a job slot iff the request will become a job. queued=True
+    (the /jobs endpoints) reserves before decoding, so a full queue answers 429 without
+    any decoding work; otherwise the slot is reserved only once the clip turns out to be
+    over SYNC_MAX_SEC, and short clips that run inline never touch the queue. The caller
+    submits on the slot (_submit).
+    """
+    if queued:
+        _reserve_slot()
+    try:
+        source = await run_in_threadpool(_read_upload, file)
+    except BaseException:
+        if queued:
+            jobs.release()
+        raise
+    if not queued and source.duration > SYNC_MAX_SEC:
+        try:
+            _reserve_slot()
+        except HTTPException:
+            source.close()
+            raise
+    return source
+
+def _run_transcribe(source, mode="full"):
     # Try to run ASR if module exists; otherwise return placeholder string.
     try:
-        from backend.asr.asr_whisper import transcribe_file
-        text = transcribe_file(file_path)
+        if mode == "speech":
+            return cache.cached_transcribe_speech_only(source, audio_key=source.key)
+        return cache.cached_transcribe_file(source, audio_key=source.key)
     except Exception as e:
-        text = f"Demo transcript placeholder. (ASR error: {e})"
-    return {"filename": file.filename, "transcript": text}
+        return f"Demo transcript placeholder. (ASR error: {e})"
+
+def _run_diarize(source):
+    try:
+        return cache.cached_vad_segments(source, audio_key=source.key)
+    except Exception as e:
+        return {"error": f"diarization not available: {e}"}
+
+async def _run_inline(fn, source, *args):
+    try:
+        return await run_in_threadpool(fn, source, *args)
+    finally:
+        source.close()
+
+def _submit(kind, fn, source, filename, *args):
+    """Queue fn(source, *args) on the slot _admit_upload reserved; the job closes the source."""
+    job = jobs.submit(kind, fn, source, *args, cleanup=source.close, reserved=True)
+    return JSONResponse(status_code=202, content={"filename": filename, **job.info()})
+
+def _transcribe_mode(mode):
+    if mode not in ("full", "speech"):
+        raise HTTPException(status_code=422, detail="mode must be 'full' or 'speech'")
+    return mode
+
+@app.post("/transcribe/")
+async def transcribe(file: UploadFile = File(...), mode: str = "full"):
+    """
+    Upload audio file -> run ASR (whisper wrapper) if available -> return transcript.
+    mode=speech runs VAD first and transcribes only the speech regions; the response
+    then also has "segments" (with word timings on the original timeline) and "speech_sec".
+    Clips longer than SYNC_MAX_SEC are queued instead: 202 + job id (see /jobs/{id}).
+    The upload is decoded in memory (see _read_upload); 413 when it is over the limits,
+    429 when the clip would be queued and the job queue is full.
+    """
+    mode = _transcribe_mode(mode)
+    source = await _admit_upload(file)
+    if source.duration > SYNC_MAX_SEC:
+        return _submit("transcribe", _run_transcribe, source, file.filename, mode)
+    result = await _run_inline(_run_transcribe, source, mode)
+    if isinstance(result, dict):
+        return {"filename": file.filename, "transcript": result["text"], "segments": result["segments"],
+                "duration": result["duration"], "speech_sec": result["speech_sec"]}
+    return {"filename": file.filename, "transcript": result}
 
 @app.post("/diarize/")
 async def diarize(file: UploadFile = File(...)):
     """
-    Upload audio file -> run diarization (VAD+placeholder clustering) -> return segments.
+    Upload audio file -> run diarization (VAD+speaker clustering) -> return segments.
+    Clips longer than SYNC_MAX_SEC are queued instead: 202 + job id (see /jobs/{id}).
     """
-    file_path = os.path.join(UPLOAD_DIR, file.filename)
-    with open(file_path, "wb") as f:
-        shutil.copyfileobj(file.file, f)
-
-    try:
-        from backend.diarization.diarize import simple_vad_segments
-        segments = simple_vad_segments(file_path)
-    except Exception as e:
-        segments = {"error": f"diarization not available: {e}"}
+    source = await _admit_upload(file)
+    if source.duration > SYNC_MAX_SEC:
+        return _submit("diarize", _run_diarize, source, file.filename)
+    segments = await _run_inline(_run_diarize, source)
     return {"filename": file.filename, "segments": segments}
 
+@app.post("/jobs/transcribe")
+async def submit_transcribe(file: UploadFile = File(...), mode: str = "full"):
+    """Queue ASR for an upload (mode=full|speech); returns 202 + job id, or 429 when the queue is full."""
+    mode = _transcribe_mode(mode)
+    source = await _admit_upload(file, queued=True)
+    return _submit("transcribe", _run_transcribe, source, file.filename, mode)
+
+@app.post("/jobs/diarize")
+async def submit_diarize(file: UploadFile = File(...)):
+    """Queue diarization for an upload; returns 202 + job id, or 429 when the queue is full."""
+    source = await _admit_upload(file, queued=True)
+    return _submit("diarize", _run_diarize, source, file.filename)
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="unknown job")
+    return {**job.info(), "queue_depth": jobs.depth}
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="unknown job")
+    if job.status == "error":
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"job is {job.status}")
+    return {"job_id": job.id, "kind": job.kind, "result": job.result}
+
+def _job_transcript(job):
+    from backend.transcript import Transcript
+    if job.transcript is None:
+        result = job.result
+        segments = result.get("segments") if isinstance(result, dict) else result
+        if not isinstance(segments, list):
+            raise HTTPException(status_code=409, detail=f"{job.kind} job has no segments")
+        job.transcript = Transcript.from_segments(segments)
+    return job.transcript
+
+@app.get("/jobs/{job_id}/segments")
+def job_segments(job_id: str, start: float = 0.0, end: Optional[float] = None):
+    """
+    Segments of a finished diarize (or mode=speech transcribe) job that overlap
+    [start, end) seconds; the whole transcript when `end` is omitted. Word timings
+    are not included (see /jobs/{id}/result for the full result).
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="unknown job")
+    if job.status == "error":
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"job is {job.status}")
+    transcript = _job_transcript(job)
+    segments = transcript.between(start, float("inf") if end is None else end)
+    return {"job_id": job.id, "start": start, "end": end, "segments": segments.to_segments()}
+
+@app.get("/search")
+def search(q: str, limit: int = 20, meeting: Optional[str] = None, speaker: Optional[str] = None):
+    """
+    Full-text search across every indexed transcript (backend.search): BM25-ranked
+    hits with meeting, speaker, start/end seconds and a highlighted snippet.
+    """
+    from backend import search as search_index
+    if not 1 <= limit <= 200:
+        raise HTTPException(status_code=422, detail="limit must be between 1 and 200")
+    with metrics.span("search"):
+        hits = search_index.index.search(q, limit=limit, meeting=meeting, speaker=speaker)
+    return {"query": q, "hits": hits}
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape endpoint: stage spans, audio-vs-processing histograms, caches, queue depth."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+def cache_stats():
+    return cache.results.stats()
+
+@app.get("/models")
+def model_stats():
+    from backend.models import registry
+    return registry.stats()
+
+def _run_actions(segments):
+    from backend.summarizer.extract_actions import summarize_transcript
+    return summarize_transcript(segments)
+
 @app.post("/actions/")
 async def actions(body: dict):
     """
     Accept JSON body: {"text": "<transcript here>"} -> extracts action items.
+    Or a diarized transcript: {"segments": [{"speaker", "start", "end", "text"}, ...]}
+    -> {"summary", "chunks", "actions": [{"text", "speaker", "start", "end", "chunk"}]}.
+    Transcripts needing more than ACTIONS_SYNC_MAX_CHUNKS summarizer chunks are queued:
+    202 + job id (see /jobs/{id}).
     """
+    segments = body.get("segments")
+    if segments is not None:
+        if not isinstance(segments, list) or not all(isinstance(s, dict) for s in segments):
+            raise HTTPException(status_code=422, detail="segments must be a list of objects")
+        from backend.transcript import Transcript
+        try:
+            segments = Transcript.from_segments(segments)  # compact copy for the (possibly queued) job
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=422, detail="every segment needs numeric start and end")
+        from backend.summarizer.extract_actions import chunk_segments
+        if len(chunk_segments(segments)) > ACTIONS_SYNC_MAX_CHUNKS:
+            try:
+                job = jobs.submit("actions", _run_actions, segments)
+            except QueueFull:
+                raise HTTPException(status_code=429, detail="job queue is full, retry later")
+            return JSONResponse(status_code=202, content=job.info())
+        try:
+            return await run_in_threadpool(_run_actions, segments)
+        except Exception as e:
+            return {"actions": {"error": f"extractor not available: {e}"}}
     text = body.get("text", "")
     try:
         from backend.summarizer.extract_actions import extract_actions_from_text
-        actions = extract_actions_from_text(text)
+        actions = await run_in_threadpool(extract_actions_from_text, text)
     except Exception as e:
         actions = {"error": f"extractor not available: {e}"}
     return {"actions": actions}
 
+@app.post("/live/start")
+async def live_start(body: dict = None):
+    """
+    Start capturing from the server's microphone and push captions to subscribers.
+    Optional JSON body: {"device": 0, "model": "small", "language": "en", "partial_sec": 2}
+    """
+    global _live
+    body = body or {}
+    if _live is not None:
+        return {"status": "already running"}
+    from backend.live_pipeline import LiveTranscriber
+    live = LiveTranscriber(device=body.get("device"), model=body.get("model", "small"),
+                           language=body.get("language", "en"), on_caption=captions.publish,
+                           partial_sec=body.get("partial_sec", 2))
+    _live = live  # claimed before the await so a concurrent start sees it
+    try:
+        # opens the input stream and loads the model: keep it off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, live.start)
+    except Exception as e:
+        _live = None
+        raise HTTPException(status_code=500, detail=f"live capture not available: {e}")
+    return {"status": "started"}
+
+@app.post("/live/stop")
+async def live_stop():
+    global _live
+    if _live is None:
+        return {"status": "not running"}
+    live, _live = _live, None
+    await asyncio.get_running_loop().run_in_executor(None, live.stop)
+    return {"status": "stopped"}
+
+@app.get("/latest_caption")
+def latest_caption():
+    """Kept for old polling clients; prefer /captions/stream or /captions/ws."""
+    cap = captions.latest
+    return {"caption": cap["text"] if cap else None}
+
+@app.get("/captions/stream")
+async def captions_stream():
+    """Server-Sent Events: `event: partial|final`, `data: {caption json}`."""
+    return StreamingResponse(captions.sse_events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.websocket("/captions/ws")
+async def captions_ws(ws: WebSocket):
+    await ws.accept()
+    q = captions.subscribe()
+    try:
+        if captions.latest is not None:
+            await ws.send_json(captions.latest)
+        while True:
+            await ws.send_json(await q.get())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        captions.unsubscribe(q)
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
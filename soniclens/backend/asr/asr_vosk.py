@@ -5,26 +5,26 @@ Robust VOSK transcription helper.
 
 Usage:
   python backend/asr/asr_vosk.py data/samples/test1.wav --model models/vosk-model-small-en-us-0.15
+  python backend/asr/asr_vosk.py data/samples/test1.wav --stream   # JSON lines: partial/final + word timings
 
-If input audio is not mono 16-bit WAV, the script will attempt to convert it (requires ffmpeg + pydub).
+A VoskEngine loads its model once (through the shared model registry) and keeps
+idle recognizers per sample rate for reuse. If input audio is not mono 16-bit WAV
+it is read from the memory-mapped, decoded-once copy (backend.audio.open_audio).
 """
 
 import argparse
 import json
 import os
 import sys
-import tempfile
+import threading
 import wave
-from vosk import Model, KaldiRecognizer
+from contextlib import contextmanager
+from typing import Iterable, Iterator
 
-# Optional conversion
-try:
-    from pydub import AudioSegment
-    HAVE_PYDUB = True
-except Exception:
-    HAVE_PYDUB = False
+import numpy as np
+from vosk import Model, KaldiRecognizer
 
-CHUNK_BYTES = 4000  # typical chunk size used in VOSK examples
+CHUNK_FRAMES = 4000  # frames per read (8000 bytes of 16-bit mono), typical VOSK chunk
 
 def is_mono_16bit_wav(path):
     try:
@@ -33,74 +33,118 @@ def is_mono_16bit_wav(path):
     except wave.Error:
         return False
 
-def convert_to_mono_16bit(src_path):
-    """Convert any audio file to mono 16-bit WAV (16000 Hz) using pydub.
-       Returns path to temporary WAV file (caller should remove it)."""
-    if not HAVE_PYDUB:
-        raise RuntimeError("pydub not installed. Install it with `pip install pydub` and ensure ffmpeg is on PATH.")
-    audio = AudioSegment.from_file(src_path)
-    audio = audio.set_frame_rate(16000).set_channels(1).set_sample_width(2)
-    fd, tmp_path = tempfile.mkstemp(suffix=".wav")
-    os.close(fd)
-    audio.export(tmp_path, format="wav")
-    return tmp_path
-
-def transcribe_vosk(wav_path, model_path, convert_if_needed=True):
-    if not os.path.exists(model_path):
-        raise FileNotFoundError(f"VOSK model not found at '{model_path}'. Download and unzip a model into this path.")
-
-    use_tmp = None
-    wav_to_open = wav_path
-    if not is_mono_16bit_wav(wav_path):
+class VoskEngine:
+    """
+    Long-lived VOSK engine for one model directory.
+
+    All stream_* methods yield dicts:
+      {"type": "partial", "text": ...}
+      {"type": "final", "text": ..., "words": [{"word", "start", "end", "conf"}, ...]}
+    Word times are seconds from the start of the stream, plus `offset`.
+    """
+    def __init__(self, model_path: str):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"VOSK model not found at '{model_path}'. Download and unzip a model into this path.")
+        self.model_path = model_path
+        self.model = Model(model_path)
+        self._idle = {}  # sample_rate -> [KaldiRecognizer]
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def recognizer(self, sample_rate: int):
+        """Borrow a recognizer for `sample_rate`; it is reset and returned to the pool afterwards."""
+        with self._lock:
+            pool = self._idle.setdefault(int(sample_rate), [])
+            rec = pool.pop() if pool else None
+        if rec is None:
+            rec = KaldiRecognizer(self.model, sample_rate)
+            rec.SetWords(True)  # include word-level timing
+        try:
+            yield rec
+        finally:
+            rec.Reset()
+            with self._lock:
+                self._idle[int(sample_rate)].append(rec)
+
+    def stream_pcm(self, chunks: Iterable[bytes], sample_rate: int, partials: bool = True,
+                   offset: float = 0.0) -> Iterator[dict]:
+        """Recognize 16-bit mono PCM byte chunks (file blocks or live capture)."""
+        with self.recognizer(sample_rate) as rec:
+            last_partial = ""
+            for data in chunks:
+                if not data:
+                    continue
+                if rec.AcceptWaveform(data):
+                    res = _final(json.loads(rec.Result()), offset)
+                    last_partial = ""
+                    if res["text"]:
+                        yield res
+                elif partials:
+                    partial = json.loads(rec.PartialResult()).get("partial", "")
+                    if partial and partial != last_partial:
+                        last_partial = partial
+                        yield {"type": "partial", "text": partial}
+            res = _final(json.loads(rec.FinalResult()), offset)
+            if res["text"]:
+                yield res
+
+    def stream_array(self, audio: np.ndarray, sample_rate: int = 16000, partials: bool = True,
+                     offset: float = 0.0) -> Iterator[dict]:
+        """Recognize an in-memory mono buffer (float in [-1, 1] or int16)."""
+        if audio.dtype.kind != "i" or audio.dtype.itemsize != 2:
+            audio = (np.clip(audio, -1.0, 1.0) * 32767.0).astype(np.int16)
+        pcm = audio.astype("<i2", copy=False)
+        chunks = (pcm[i:i + CHUNK_FRAMES].tobytes() for i in range(0, len(pcm), CHUNK_FRAMES))
+        yield from self.stream_pcm(chunks, sample_rate, partials=partials, offset=offset)
+
+    def stream_file(self, path: str, partials: bool = True, convert_if_needed: bool = True) -> Iterator[dict]:
+        if is_mono_16bit_wav(path):
+            with wave.open(path, "rb") as wf:
+                sample_rate = wf.getframerate()
+                chunks = iter(lambda: wf.readframes(CHUNK_FRAMES), b"")
+                yield from self.stream_pcm(chunks, sample_rate, partials=partials)
+            return
         if not convert_if_needed:
             raise ValueError("Input WAV must be mono 16-bit. Either convert the file or run with --convert.")
-        if not HAVE_PYDUB:
-            raise RuntimeError("Audio is not mono 16-bit and pydub/ffmpeg are not available to convert it.")
-        print("[INFO] Converting input to mono 16-bit WAV (16000 Hz) using pydub/ffmpeg...")
-        use_tmp = convert_to_mono_16bit(wav_path)
-        wav_to_open = use_tmp
-
-    # Open WAV and run recognizer
-    with wave.open(wav_to_open, "rb") as wf:
-        sample_rate = wf.getframerate()
-        model = Model(model_path)
-        rec = KaldiRecognizer(model, sample_rate)
-        rec.SetWords(True)  # include word-level timing if available
-
-        results = []
-        while True:
-            data = wf.readframes(CHUNK_BYTES)
-            if len(data) == 0:
-                break
-            if rec.AcceptWaveform(data):
-                r = json.loads(rec.Result())
-                text = r.get("text", "")
-                if text:
-                    results.append(text)
-            else:
-                # optional: handle partial results if you want streaming feedback
-                # partial = json.loads(rec.PartialResult()).get("partial", "")
-                # if partial: print("PARTIAL:", partial)
-                pass
-
-        final_r = json.loads(rec.FinalResult())
-        final_text = final_r.get("text", "")
-        if final_text:
-            results.append(final_text)
-
-    if use_tmp:
-        try:
-            os.remove(use_tmp)
-        except Exception:
-            pass
+        from backend.audio import open_audio
+        with open_audio(path) as source:
+            # int16 map -> byte chunks straight from the page cache, nothing decoded into RAM
+            yield from self.stream_array(source.samples, source.sr, partials=partials)
+
+    def transcribe(self, path: str, convert_if_needed: bool = True) -> dict:
+        """{"text": joined final text, "words": all word timings}"""
+        texts, words = [], []
+        for res in self.stream_file(path, partials=False, convert_if_needed=convert_if_needed):
+            texts.append(res["text"])
+            words.extend(res["words"])
+        return {"text": " ".join(texts), "words": words}
+
+def _final(r: dict, offset: float) -> dict:
+    words = r.get("result", [])
+    if offset:
+        for w in words:
+            w["start"] += offset
+            w["end"] += offset
+    return {"type": "final", "text": r.get("text", ""), "words": words}
+
+def get_engine(model_path: str) -> VoskEngine:
+    """Engine (model + recognizer pool) from the shared registry: loaded once per process."""
+    from backend.models import registry, dir_size
+    key = f"vosk:{os.path.abspath(model_path)}"
+    return registry.get(key, lambda: VoskEngine(model_path), size=lambda _: dir_size(model_path))
+
+def load_vosk_model(model_path):
+    return get_engine(model_path).model
 
-    return " ".join([s for s in results if s])
+def transcribe_vosk(wav_path, model_path, convert_if_needed=True):
+    return get_engine(model_path).transcribe(wav_path, convert_if_needed=convert_if_needed)["text"]
 
 def main():
-    parser = argparse.ArgumentParser(description="Transcribe WAV using VOSK (mono 16-bit required).")
+    parser = argparse.ArgumentParser(description="Transcribe audio using VOSK.")
     parser.add_argument("wav", help="Path to WAV/audio file")
     parser.add_argument("--model", "-m", default="models/vosk-model-small-en-us-0.15", help="Path to VOSK model directory")
     parser.add_argument("--no-convert", action="store_true", help="Do not attempt to auto-convert non-mono WAV files")
+    parser.add_argument("--stream", action="store_true", help="Print partial/final results with word timings as JSON lines")
     args = parser.parse_args()
 
     wav_path = args.wav
@@ -111,9 +155,14 @@ def main():
         sys.exit(2)
 
     try:
-        transcript = transcribe_vosk(wav_path, model_path, convert_if_needed=not args.no_convert)
-        print("=== TRANSCRIPT ===")
-        print(transcript)
+        engine = get_engine(model_path)
+        if args.stream:
+            for res in engine.stream_file(wav_path, convert_if_needed=not args.no_convert):
+                print(json.dumps(res, ensure_ascii=False), flush=True)
+        else:
+            transcript = engine.transcribe(wav_path, convert_if_needed=not args.no_convert)["text"]
+            print("=== TRANSCRIPT ===")
+            print(transcript)
     except Exception as e:
         print("[ERROR]", str(e), file=sys.stderr)
         sys.exit(1)
@@ -1,46 +1,188 @@
 # backend/asr/asr_whisper.py
 import os
-from typing import Optional
+import time
+from typing import List, Optional, Sequence
+import numpy as np
 import whisper
 
-_MODEL_CACHE = {}
+from backend.asr.whisper_options import DECODE_OPTIONS, INT8_DEVICE, _resolve, model_tag
+from backend.metrics import span, observe_audio
+from backend.models import registry
 
-def _preferred_device(device: Optional[str]) -> str:
-    # priority: explicit arg > WHISPER_DEVICE env var > cpu
-    if device:
-        return device
-    return os.environ.get("WHISPER_DEVICE", "cpu")
+FILE_WINDOW_SEC = 600  # transcribe_file reads long recordings this many seconds at a time
+
+INT8_CACHE_DIR = os.environ.get("SONICLENS_WHISPER_INT8_DIR", os.path.join("data", "cache", "whisper"))
+
+def quantize_int8(model):
+    """
+    Dynamic int8 quantization of every linear layer (weights int8, activations
+    quantized on the fly); conv front-end, embeddings and layer norms stay fp32.
+    quantize_dynamic only swaps modules whose type is exactly nn.Linear, and whisper
+    uses its own Linear subclass, so those are replaced by plain nn.Linear first.
+    """
+    import torch
+    from torch import nn
+    model = model.cpu().float().eval()
+    for parent in list(model.modules()):
+        for child_name, child in list(parent.named_children()):
+            if isinstance(child, nn.Linear) and type(child) is not nn.Linear:
+                linear = nn.Linear(child.in_features, child.out_features, bias=child.bias is not None)
+                linear.weight = child.weight
+                linear.bias = child.bias
+                setattr(parent, child_name, linear)
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+def _int8_path(name: str) -> str:
+    import torch
+    # packed int8 weights are tied to the torch build that produced them
+    return os.path.join(INT8_CACHE_DIR, f"{name}-int8-torch{torch.__version__}.pt")
+
+def _load_int8(name: str):
+    """Quantized model from the on-disk cache, or quantize the fp32 checkpoint once and store it."""
+    import torch
+    path = _int8_path(name)
+    if os.path.exists(path):
+        try:
+            return torch.load(path, map_location="cpu", weights_only=False).eval()
+        except Exception as e:
+            print(f"[WARN] ignoring unreadable int8 cache {path}: {e}")
+    model = quantize_int8(whisper.load_model(name, device="cpu"))
+    os.makedirs(INT8_CACHE_DIR, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    torch.save(model, tmp)
+    os.replace(tmp, path)  # atomic: another process never loads half a file
+    return model
 
 def load_model(name: str = "small", device: Optional[str] = None):
-    device = _preferred_device(device)
-    cache_key = f"{name}:{device}"
-    if cache_key not in _MODEL_CACHE:
-        # whisper.load_model accepts a device parameter
-        # (if your whisper version doesn't support it, you can set torch.device beforehand)
-        _MODEL_CACHE[cache_key] = whisper.load_model(name, device=device)
-    return _MODEL_CACHE[cache_key]
+    name, device = _resolve(name, device)
+    # shared, size-bounded registry; concurrent first calls load the model once
+    if device == INT8_DEVICE:
+        # packed int8 weights aren't parameters, so size the model by its cache file
+        return registry.get(f"whisper:{name}:{device}", lambda: _load_int8(name),
+                            size=lambda _: os.path.getsize(_int8_path(name)))
+    # (whisper.load_model accepts a device parameter; if your whisper version doesn't
+    # support it, you can set torch.device beforehand)
+    return registry.get(f"whisper:{name}:{device}", lambda: whisper.load_model(name, device=device))
+
+def warmup(name: str = "small", device: Optional[str] = None):
+    """Load the model and run one short decode so kernels/allocations are ready."""
+    transcribe_array(np.zeros(whisper.audio.SAMPLE_RATE, dtype=np.float32), model_name=name, device=device)
 
 def transcribe_file(path: str, language: str = "en", model_name: str = "small", device: Optional[str] = None) -> str:
     """
     Transcribe a single file and return the text.
     Use model_name and device to control speed/accuracy and hardware.
+    The file is memory-mapped (backend.audio.open_audio) and fed to whisper in
+    FILE_WINDOW_SEC windows cut at quiet frames, so long recordings are never
+    decoded into RAM as a whole.
+    """
+    from backend.audio import open_audio
+    model = load_model(model_name, device=device)
+    texts = []
+    # tune DECODE_OPTIONS as needed
+    with span("asr", mode="file"), open_audio(path) as source:
+        for _, window in source.iter_windows(FILE_WINDOW_SEC):
+            res = model.transcribe(window, language=language, **DECODE_OPTIONS)
+            texts.append(res.get("text", "").strip())
+    return " ".join(t for t in texts if t)
+
+def transcribe_array(audio: np.ndarray, language: str = "en", model_name: str = "small", device: Optional[str] = None) -> str:
+    """
+    Array-input counterpart of transcribe_file: `audio` is 16 kHz mono float32 PCM
+    (e.g. a view returned by backend.audio.slice_segment). Skips the decode step.
     """
+    if audio.size == 0:
+        return ""
     model = load_model(model_name, device=device)
-    # tune these parameters as needed:
-    res = model.transcribe(path,
-                           language=language,
-                           condition_on_previous_text=False,
-                           no_speech_threshold=0.6,
-                           logprob_threshold=-1.0,
-                           compression_ratio_threshold=2.4)
+    t0 = time.perf_counter()
+    with span("asr", mode="array"):
+        res = model.transcribe(np.ascontiguousarray(audio, dtype=np.float32), language=language, **DECODE_OPTIONS)
+    observe_audio("asr", audio.shape[-1] / whisper.audio.SAMPLE_RATE, time.perf_counter() - t0)
     return res.get("text", "").strip()
 
+def transcribe_batch(audios: Sequence[np.ndarray], language: str = "en", model_name: str = "small",
+                     device: Optional[str] = None, batch_size: int = 8) -> List[str]:
+    """
+    Transcribe N segment arrays (16 kHz mono float32), returning texts in input order.
+    Segments up to 30 s are padded into one mel window each and run through the
+    encoder and decoder `batch_size` at a time. Longer segments, and batched results
+    that trip the usual quality thresholds, go through transcribe_array so they still
+    get whisper's temperature fallback.
+    """
+    import torch
+    model = load_model(model_name, device=device)
+    n_mels = getattr(model.dims, "n_mels", 80)
+    options = whisper.DecodingOptions(language=language, without_timestamps=True,
+                                      fp16=model.device.type != "cpu")
+    t0 = time.perf_counter()
+    texts = [""] * len(audios)
+    batchable = []
+    # fallbacks are observed as "asr" by transcribe_array; keep them out of the batch totals
+    fallback = {"samples": 0, "sec": 0.0}
+
+    def single(i):
+        t = time.perf_counter()
+        texts[i] = transcribe_array(audios[i], language=language, model_name=model_name, device=device)
+        fallback["sec"] += time.perf_counter() - t
+        fallback["samples"] += audios[i].shape[-1]
+
+    for i, audio in enumerate(audios):
+        if audio.size == 0:
+            continue
+        if audio.shape[-1] > whisper.audio.N_SAMPLES:
+            single(i)
+        else:
+            batchable.append(i)
+
+    for b in range(0, len(batchable), max(1, batch_size)):
+        idx = batchable[b:b + max(1, batch_size)]
+        mels = torch.stack([
+            whisper.log_mel_spectrogram(
+                whisper.pad_or_trim(np.ascontiguousarray(audios[i], dtype=np.float32)),
+                n_mels, device=model.device)
+            for i in idx
+        ])
+        with torch.no_grad(), span("asr", mode="batch"):
+            results = whisper.decode(model, mels, options)
+        for i, r in zip(idx, results):
+            if (r.no_speech_prob > DECODE_OPTIONS["no_speech_threshold"]
+                    and r.avg_logprob < DECODE_OPTIONS["logprob_threshold"]):
+                continue  # silence, same rule transcribe() applies
+            if (r.compression_ratio > DECODE_OPTIONS["compression_ratio_threshold"]
+                    or r.avg_logprob < DECODE_OPTIONS["logprob_threshold"]):
+                single(i)
+            else:
+                texts[i] = r.text.strip()
+    batched = sum(a.shape[-1] for a in audios) - fallback["samples"]
+    if batched:
+        observe_audio("asr_batch", batched / whisper.audio.SAMPLE_RATE,
+                      time.perf_counter() - t0 - fallback["sec"])
+    return texts
+
+def transcribe_words(audio: np.ndarray, language: str = "en", model_name: str = "small",
+                     device: Optional[str] = None) -> List[dict]:
+    """
+    Word-level transcription of one 16 kHz mono float32 buffer (e.g. a packed window
+    from backend.asr.packing): [{"word", "start", "end", "probability"}, ...] with
+    times relative to the buffer. Words keep whisper's leading spaces.
+    """
+    if audio.size == 0:
+        return []
+    model = load_model(model_name, device=device)
+    t0 = time.perf_counter()
+    with span("asr", mode="packed"):
+        res = model.transcribe(np.ascontiguousarray(audio, dtype=np.float32), language=language,
+                               word_timestamps=True, **DECODE_OPTIONS)
+    observe_audio("asr_packed", audio.shape[-1] / whisper.audio.SAMPLE_RATE, time.perf_counter() - t0)
+    return [{"word": w["word"], "start": w["start"], "end": w["end"], "probability": w.get("probability")}
+            for seg in res.get("segments", []) for w in seg.get("words", [])]
+
 if __name__ == "__main__":
     import argparse, sys
     p = argparse.ArgumentParser()
     p.add_argument("audio", help="path to audio file")
     p.add_argument("--model", default="small", help="whisper model name")
-    p.add_argument("--device", default=None, help="device: cpu / mps / cuda")
+    p.add_argument("--device", default=None, help="device: cpu / cpu-int8 / mps / cuda")
     p.add_argument("--language", default="en")
     args = p.parse_args()
     print(transcribe_file(args.audio, language=args.language, model_name=args.model, device=args.device))
@@ -0,0 +1,102 @@
+# backend/asr/packing.py
+"""
+Segment packing between diarization and ASR.
+
+VAD cuts meetings into many short (often sub-second) segments, and each one
+transcribed on its own still costs a full 30 s Whisper window. Packer groups
+adjacent segments (start order) into windows of up to PACK_WINDOW_SEC of
+padded speech, laid out the way speech-only mode does it (regions back to
+back with a short gap, speech_only.Timeline for the way back). Each window is
+transcribed once with word timestamps; PackedWindow.finish() hands every word
+to the segment whose time span it falls in, so callers still get one
+{speaker, start, end, text} entry per original segment.
+"""
+import bisect
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from backend.asr.speech_only import JOIN_GAP_SEC, Timeline, _compact, speech_regions
+
+PACK_WINDOW_SEC = 28.0  # compact audio per window; whisper reads 30 s, the rest is headroom
+PACK_PAD_SEC = 0.15     # kept around each segment (same margin as pipeline.PRE_ROLL/POST_ROLL)
+
+class PackedWindow:
+    """Segments transcribed together: `audio` is their compact buffer, `timeline` maps it back."""
+    def __init__(self, entries: List[Dict], audio, timeline: Timeline):
+        self.entries = entries
+        self.audio = audio
+        self.timeline = timeline
+
+    def assign(self, words: Iterable[Dict]) -> List[str]:
+        """Text per entry: each word goes to the segment containing (or nearest to) its midpoint."""
+        starts = [e["start"] for e in self.entries]
+        parts = [[] for _ in self.entries]
+        for w in words:
+            mid = self.timeline.to_original((w["start"] + w["end"]) / 2)
+            i = max(0, bisect.bisect_right(starts, mid) - 1)
+            if (mid > self.entries[i]["end"] and i + 1 < len(self.entries)
+                    and self.entries[i + 1]["start"] - mid < mid - self.entries[i]["end"]):
+                i += 1
+            parts[i].append(w["word"])
+        return ["".join(p).strip() for p in parts]
+
+    def finish(self, words: Iterable[Dict]) -> List[Dict]:
+        for entry, text in zip(self.entries, self.assign(words)):
+            entry["text"] = text
+        return self.entries
+
+    def failed(self, error) -> List[Dict]:
+        for entry in self.entries:
+            entry["text"] = f"[ASR error: {error}]"
+        return self.entries
+
+class Packer:
+    """
+    Incremental grouping: add() segments in start order; it returns a PackedWindow
+    whenever the next segment would overflow the current one. flush() packs the rest.
+    A segment longer than the window gets a window of its own.
+    """
+    def __init__(self, source, window_sec: float = PACK_WINDOW_SEC, pad: float = PACK_PAD_SEC):
+        self.source = source
+        self.window_sec = window_sec
+        self.pad = pad
+        self._entries = []
+        self._size = 0.0
+        self._last_end = None
+
+    def _cost(self, entry) -> float:
+        """Compact seconds `entry` adds; padded neighbours that overlap share their audio."""
+        start, end = entry["start"] - self.pad, entry["end"] + self.pad
+        if self._last_end is not None and start <= self._last_end:
+            return max(0.0, end - self._last_end)
+        return end - start + JOIN_GAP_SEC
+
+    def add(self, entry: Dict) -> Optional[PackedWindow]:
+        done = None
+        if self._entries and self._size + self._cost(entry) > self.window_sec:
+            done = self.flush()
+        self._size += self._cost(entry)
+        self._entries.append(entry)
+        end = entry["end"] + self.pad
+        self._last_end = end if self._last_end is None else max(self._last_end, end)
+        return done
+
+    def flush(self) -> Optional[PackedWindow]:
+        if not self._entries:
+            return None
+        entries = self._entries
+        self._entries, self._size, self._last_end = [], 0.0, None
+        regions = speech_regions(entries, self.source.duration, self.pad)
+        audio, timeline = _compact(self.source, regions, self.source.sr)
+        return PackedWindow(entries, audio, timeline)
+
+def iter_windows(source, entries: Iterable[Dict], window_sec: float = PACK_WINDOW_SEC,
+                 pad: float = PACK_PAD_SEC) -> Iterator[PackedWindow]:
+    """Batch form of Packer over `entries` (start order)."""
+    packer = Packer(source, window_sec, pad)
+    for entry in entries:
+        window = packer.add(entry)
+        if window is not None:
+            yield window
+    window = packer.flush()
+    if window is not None:
+        yield window
@@ -0,0 +1,137 @@
+# backend/asr/speech_only.py
+"""
+Speech-only transcription: run VAD first, transcribe only the speech.
+
+The VAD regions (diarize.simple_vad_segments) are padded, merged and copied
+back to back into a compact buffer with a short silence between them, then
+Whisper transcribes that buffer with word timestamps. A Timeline maps every
+compact-buffer time back to the original recording, so ASR cost follows the
+amount of speech, not the length of the file.
+
+Usage:
+  python backend/asr/speech_only.py data/samples/meeting1.wav [--model small] [--device cpu]
+"""
+import bisect
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from backend.metrics import span, observe_audio
+
+REGION_PAD_SEC = 0.2   # kept around each VAD region so word edges survive
+JOIN_GAP_SEC = 0.3     # silence inserted between regions in the compact buffer
+WINDOW_SEC = 600       # compact audio transcribed per whisper call (bounds memory)
+
+def speech_regions(segments: Sequence[Dict], duration: float, pad: float = REGION_PAD_SEC) -> List[List[float]]:
+    """VAD segments -> padded, sorted, non-overlapping [start, end] regions (seconds)."""
+    regions = []
+    for seg in sorted(segments, key=lambda s: s["start"]):
+        start = max(0.0, float(seg["start"]) - pad)
+        end = min(duration, float(seg["end"]) + pad)
+        if end <= start:
+            continue
+        if regions and start <= regions[-1][1]:
+            regions[-1][1] = max(regions[-1][1], end)
+        else:
+            regions.append([start, end])
+    return regions
+
+class Timeline:
+    """
+    Piecewise mapping from compact-buffer seconds to original seconds. Times that
+    fall into an inserted gap snap to the nearer of the two regions around it.
+    """
+    def __init__(self):
+        self.compact_starts = []  # where each region begins in the compact buffer
+        self.orig_starts = []
+        self.lengths = []
+
+    def add(self, compact_start: float, orig_start: float, length: float):
+        self.compact_starts.append(compact_start)
+        self.orig_starts.append(orig_start)
+        self.lengths.append(length)
+
+    def to_original(self, t: float) -> float:
+        i = max(0, bisect.bisect_right(self.compact_starts, t) - 1)
+        offset = t - self.compact_starts[i]
+        if offset > self.lengths[i] and i + 1 < len(self.compact_starts):
+            if self.compact_starts[i + 1] - t < offset - self.lengths[i]:
+                return self.orig_starts[i + 1]
+        return self.orig_starts[i] + min(max(0.0, offset), self.lengths[i])
+
+def _windows(regions, window_sec):
+    """Group regions so each whisper call sees at most ~window_sec of compact audio."""
+    group, size = [], 0.0
+    for r in regions:
+        length = r[1] - r[0] + JOIN_GAP_SEC
+        if group and size + length > window_sec:
+            yield group
+            group, size = [], 0.0
+        group.append(r)
+        size += length
+    if group:
+        yield group
+
+def _compact(source, regions, sr):
+    """Regions copied back to back (JOIN_GAP_SEC of silence between) + their Timeline."""
+    gap = np.zeros(int(JOIN_GAP_SEC * sr), dtype=np.float32)
+    parts, timeline, pos = [], Timeline(), 0
+    for start, end in regions:
+        clip = source.window(start, end)
+        timeline.add(pos / sr, start, len(clip) / sr)
+        parts.extend((clip, gap))
+        pos += len(clip) + len(gap)
+    return (np.concatenate(parts) if parts else np.zeros(0, np.float32)), timeline
+
+def transcribe_speech_only(path: str, language: str = "en", model_name: str = "small",
+                           device: Optional[str] = None, segments: Optional[Sequence[Dict]] = None) -> Dict:
+    """
+    Returns {"text", "segments": [{"start", "end", "text", "words": [{"word", "start", "end", "probability"}]}],
+             "duration", "speech_sec"} with every time on the original timeline.
+    `segments` are VAD/diarization segments; simple_vad_segments(path) is run when omitted.
+    """
+    from backend.asr.asr_whisper import load_model, DECODE_OPTIONS
+    from backend.audio import open_audio
+    if segments is None:
+        from backend.diarization.diarize import simple_vad_segments
+        segments = simple_vad_segments(path)
+    t0 = time.perf_counter()
+    model = load_model(model_name, device=device)
+    out_segments = []
+    with open_audio(path) as source:
+        duration = source.duration
+        regions = speech_regions(segments, duration)
+        speech_sec = sum(end - start for start, end in regions)
+        for group in _windows(regions, WINDOW_SEC):
+            audio, timeline = _compact(source, group, source.sr)
+            with span("asr", mode="speech_only"):
+                res = model.transcribe(audio, language=language, word_timestamps=True, **DECODE_OPTIONS)
+            for seg in res.get("segments", []):
+                text = seg.get("text", "").strip()
+                if not text:
+                    continue
+                out_segments.append({
+                    "start": timeline.to_original(seg["start"]),
+                    "end": timeline.to_original(seg["end"]),
+                    "text": text,
+                    "words": [{"word": w["word"].strip(),
+                               "start": timeline.to_original(w["start"]),
+                               "end": timeline.to_original(w["end"]),
+                               "probability": w.get("probability")}
+                              for w in seg.get("words", [])],
+                })
+    observe_audio("asr_speech_only", duration, time.perf_counter() - t0)
+    return {"text": " ".join(s["text"] for s in out_segments), "segments": out_segments,
+            "duration": duration, "speech_sec": speech_sec}
+
+if __name__ == "__main__":
+    import argparse, json
+    p = argparse.ArgumentParser()
+    p.add_argument("audio", help="path to audio file")
+    p.add_argument("--model", default="small", help="whisper model name")
+    p.add_argument("--device", default=None, help="device: cpu / cpu-int8 / mps / cuda")
+    p.add_argument("--language", default="en")
+    args = p.parse_args()
+    print(json.dumps(transcribe_speech_only(args.audio, language=args.language, model_name=args.model,
+                                            device=args.device), indent=2, ensure_ascii=False))
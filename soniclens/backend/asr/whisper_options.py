@@ -0,0 +1,36 @@
+# backend/asr/whisper_options.py
+"""
+Whisper settings that don't need whisper itself: decoding parameters and the
+model/device naming. Cache keys and resume checkpoints (backend.cache,
+backend.pipeline) are built from these, so they work where whisper isn't
+installed; backend.asr.asr_whisper re-exports them.
+"""
+import os
+from typing import Optional
+
+# decoding parameters shared by the file and array entry points
+DECODE_OPTIONS = dict(condition_on_previous_text=False,
+                      no_speech_threshold=0.6,
+                      logprob_threshold=-1.0,
+                      compression_ratio_threshold=2.4)
+
+# int8 CPU mode: device "cpu-int8" (or WHISPER_DEVICE=cpu-int8, or a model name like "small-int8")
+INT8_DEVICE = "cpu-int8"
+
+def _preferred_device(device: Optional[str]) -> str:
+    # priority: explicit arg > WHISPER_DEVICE env var > cpu
+    if device:
+        return device
+    return os.environ.get("WHISPER_DEVICE", "cpu")
+
+def _resolve(name: str, device: Optional[str]):
+    """(checkpoint name, device); a "-int8" model name suffix selects the int8 CPU mode."""
+    device = _preferred_device(device)
+    if name.endswith("-int8"):
+        return name[:-len("-int8")], INT8_DEVICE
+    return name, device
+
+def model_tag(name: str = "small", device: Optional[str] = None) -> str:
+    """Name that identifies the weights actually used (for cache keys): "small" or "small-int8"."""
+    name, device = _resolve(name, device)
+    return f"{name}-int8" if device == INT8_DEVICE else name
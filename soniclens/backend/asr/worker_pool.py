@@ -0,0 +1,102 @@
+# backend/asr/worker_pool.py
+"""
+Process-pool ASR: each worker process loads the Whisper model once at startup and
+transcribes batches of segment arrays fanned out by the parent.
+
+Worker count x intra-op threads per worker should not exceed the core count,
+otherwise torch thread pools oversubscribe the CPU.
+"""
+import os
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+
+IN_FLIGHT_PER_WORKER = 2  # chunks queued per worker; bounds parent memory for long inputs
+
+_WORKER = {}
+
+def default_threads_per_worker(workers: int) -> int:
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+def _init_worker(model_name: str, device: Optional[str], language: str, threads: int):
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # already set in this process
+    from backend.asr.asr_whisper import load_model
+    load_model(model_name, device=device)  # preload so the first job doesn't pay for it
+    _WORKER.update(model_name=model_name, device=device, language=language)
+
+def _transcribe_chunk(job):
+    from backend.asr.asr_whisper import transcribe_batch
+    indices, clips, batch_size = job
+    texts = transcribe_batch(clips, language=_WORKER["language"], model_name=_WORKER["model_name"],
+                             device=_WORKER["device"], batch_size=batch_size)
+    return list(zip(indices, texts))
+
+def _transcribe_words(audio):
+    from backend.asr.asr_whisper import transcribe_words
+    return transcribe_words(audio, language=_WORKER["language"], model_name=_WORKER["model_name"],
+                            device=_WORKER["device"])
+
+class WorkerPool:
+    """
+    Context-managed pool of ASR worker processes. submit(indices, clips) returns a
+    Future of [(index, text), ...], for callers that feed clips as they arrive.
+    """
+    def __init__(self, workers: int, threads_per_worker: Optional[int] = None, language: str = "en",
+                 model_name: str = "small", device: Optional[str] = None, batch_size: int = 8):
+        self.workers = workers
+        self.batch_size = batch_size
+        threads = threads_per_worker or default_threads_per_worker(workers)
+        # spawn, not fork: forking a parent that already started torch threads can deadlock
+        self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                                         initializer=_init_worker, initargs=(model_name, device, language, threads))
+
+    @property
+    def max_in_flight(self) -> int:
+        return self.workers * IN_FLIGHT_PER_WORKER
+
+    def submit(self, indices: List[int], clips: Sequence[np.ndarray]) -> Future:
+        return self._pool.submit(_transcribe_chunk,
+                                 (list(indices), [np.ascontiguousarray(c) for c in clips], self.batch_size))
+
+    def submit_words(self, audio: np.ndarray) -> Future:
+        """Future of transcribe_words(audio) (a packed window) run in a worker."""
+        return self._pool.submit(_transcribe_words, np.ascontiguousarray(audio))
+
+    def close(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+def iter_transcribe_parallel(clips: Sequence[np.ndarray], workers: int, threads_per_worker: Optional[int] = None,
+                             language: str = "en", model_name: str = "small", device: Optional[str] = None,
+                             batch_size: int = 8) -> Iterator[List[Tuple[int, str]]]:
+    """
+    Transcribe `clips` on a pool of `workers` processes, yielding [(index, text), ...]
+    per chunk of `batch_size` clips in input order as soon as each chunk is done.
+    `clips` may be lazy (e.g. backend.audio.SegmentClips): a chunk is only read when
+    it is submitted, and at most IN_FLIGHT_PER_WORKER chunks per worker are pending.
+    """
+    if not len(clips):
+        return
+    with WorkerPool(workers, threads_per_worker, language=language, model_name=model_name,
+                    device=device, batch_size=batch_size) as pool:
+        pending = deque()
+        for b in range(0, len(clips), batch_size):
+            idx = list(range(b, min(b + batch_size, len(clips))))
+            pending.append(pool.submit(idx, [clips[i] for i in idx]))
+            if len(pending) >= pool.max_in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,513 @@
+# backend/audio.py
+"""
+Decode-once audio helpers.
+
+The source is decoded to 16 kHz mono float32 PCM a single time and segments are
+cut out of that buffer as NumPy views, so the pipelines don't need one ffmpeg
+process + temp WAV per diarized segment.
+
+For long recordings use AudioSource (open_audio): a 16 kHz mono 16-bit WAV is
+memory-mapped in place; anything else (compressed, stereo, 48 kHz, ...) is
+decoded once by ffmpeg straight to a cached WAV on disk, keyed by content hash,
+and that file is memory-mapped. Readers then pull windows out of the map, so
+peak memory follows the window size rather than the recording length.
+
+Uploads never touch data/: decode_stream() turns a byte stream straight into
+16 kHz PCM held in memory, spilled to a private (unnamed, auto-deleted) temp file
+past SONICLENS_UPLOAD_SPOOL_MB, and wraps it in the same AudioSource interface.
+Anything that accepts a path for open_audio() also accepts such a source.
+
+Env:
+  SONICLENS_PCM_CACHE_DIR      decoded-once WAVs (default data/cache/pcm)
+  SONICLENS_PCM_CACHE_MAX_MB   size budget, least recently used evicted first (default 4096)
+  SONICLENS_UPLOAD_SPOOL_MB    decoded upload PCM kept in RAM before spilling (default 64)
+"""
+import hashlib
+import io
+import os
+import struct
+import subprocess
+import tempfile
+import threading
+from typing import Iterator, Optional, Sequence, Tuple
+import numpy as np
+
+from backend.metrics import span
+
+SAMPLE_RATE = 16000
+PCM_CACHE_DIR = os.environ.get("SONICLENS_PCM_CACHE_DIR", os.path.join("data", "cache", "pcm"))
+PCM_CACHE_MAX_BYTES = int(float(os.environ.get("SONICLENS_PCM_CACHE_MAX_MB", "4096")) * 1024 * 1024)
+UPLOAD_SPOOL_BYTES = int(float(os.environ.get("SONICLENS_UPLOAD_SPOOL_MB", "64")) * 1024 * 1024)
+
+def audio_duration(path: str) -> float:
+    """Duration in seconds from the WAV header, or ffprobe for other formats."""
+    import wave
+    try:
+        with wave.open(path, "rb") as wf:
+            return wf.getnframes() / float(wf.getframerate())
+    except (wave.Error, EOFError):
+        pass
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path]
+    out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout.strip()
+    return float(out)
+
+def slice_segment(audio, start: float, end: float,
+                  pre_roll: float = 0.0, post_roll: float = 0.0,
+                  sr: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Return a view of `audio` covering [start - pre_roll, end + post_roll] seconds,
+    clamped to the buffer. No samples are copied. `audio` may also be an
+    AudioSource, in which case just that window is read (as float32).
+    """
+    if isinstance(audio, AudioSource):
+        return audio.window(start, end, pre_roll, post_roll)
+    s = max(0, int(round((start - pre_roll) * sr)))
+    e = min(len(audio), int(round((end + post_roll) * sr)))
+    return audio[s:max(s, e)]
+
+def write_wav(path: str, audio: np.ndarray, sr: int = SAMPLE_RATE):
+    """Write float32 PCM as a 16-bit mono WAV (used by script fallbacks that need a file)."""
+    import wave
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767.0).astype("<i2")
+    with wave.open(path, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sr)
+        wf.writeframes(pcm.tobytes())
+
+# --- memory-mapped sources ------------------------------------------------------
+
+def _wav_layout(path: str) -> Optional[Tuple[int, int, int, int, int]]:
+    """(data offset, data bytes, channels, sample width, rate) of a PCM WAV, else None."""
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            return _parse_wav(f, size)
+    except OSError:
+        return None
+
+def _parse_wav(f, size: Optional[int]) -> Optional[Tuple[int, int, int, int, int]]:
+    """
+    _wav_layout for an open file positioned at 0. With size=None (a stream) the data
+    length is the header's, or None when the header leaves it open (0/0xFFFFFFFF).
+    """
+    try:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+            return None
+        fmt = None
+        while True:
+            head = f.read(8)
+            if len(head) < 8:
+                return None
+            cid, clen = head[:4], struct.unpack("<I", head[4:])[0]
+            if cid == b"fmt ":
+                body = f.read(clen)
+                tag, channels, rate, _, _, bits = struct.unpack("<HHIIHH", body[:16])
+                if tag == 0xFFFE and len(body) >= 26:  # WAVE_FORMAT_EXTENSIBLE: real tag in the GUID
+                    tag = struct.unpack("<H", body[24:26])[0]
+                fmt = (tag, channels, rate, bits // 8)
+                f.seek(clen & 1, 1)
+            elif cid == b"data":
+                if fmt is None or fmt[0] != 1:
+                    return None  # not integer PCM
+                offset = f.tell()
+                if size is None:
+                    nbytes = None if clen in (0, 0xFFFFFFFF) else clen
+                elif clen in (0, 0xFFFFFFFF):  # streamed WAVs may leave 0/0xFFFFFFFF here
+                    nbytes = size - offset
+                else:
+                    nbytes = min(clen, size - offset)
+                return offset, nbytes, fmt[1], fmt[3], fmt[2]
+            else:
+                f.seek(clen + (clen & 1), 1)
+    except (OSError, struct.error):
+        return None
+
+def decoded_pcm_path(path: str) -> str:
+    """Path of a 16 kHz mono 16-bit WAV with the same audio, decoded by ffmpeg once per content hash."""
+    from backend.cache import audio_hash
+    out = os.path.join(PCM_CACHE_DIR, audio_hash(path) + ".wav")
+    if os.path.exists(out):
+        os.utime(out)  # LRU: mark as recently used
+        return out
+    os.makedirs(PCM_CACHE_DIR, exist_ok=True)
+    tmp = f"{out}.{os.getpid()}.tmp"
+    cmd = ["ffmpeg", "-nostdin", "-y", "-threads", "0", "-i", path,
+           "-ac", "1", "-ar", str(SAMPLE_RATE), "-acodec", "pcm_s16le", "-f", "wav", tmp]
+    try:
+        with span("decode"):
+            subprocess.run(cmd, capture_output=True, check=True)
+    except subprocess.CalledProcessError as e:
+        try: os.remove(tmp)
+        except OSError: pass
+        raise RuntimeError(f"Failed to decode audio: {e.stderr.decode(errors='ignore')[-500:]}") from e
+    os.replace(tmp, out)  # atomic: concurrent openers never map half a file
+    _trim_pcm_cache(keep=out)
+    return out
+
+def _trim_pcm_cache(keep: str):
+    entries = []
+    for name in os.listdir(PCM_CACHE_DIR):
+        path = os.path.join(PCM_CACHE_DIR, name)
+        if name.endswith(".wav") and path != keep:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in entries) + os.path.getsize(keep)
+    for _, size, path in sorted(entries):
+        if total <= PCM_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)  # open maps of an evicted file stay valid until closed
+            total -= size
+        except OSError:
+            pass
+
+class AudioSource:
+    """
+    16 kHz mono int16 samples of a recording, memory-mapped from disk.
+    `samples` is the raw map; window()/iter_blocks() hand out float32 copies of
+    just the requested range, which is all any reader holds in RAM.
+    """
+    sr = SAMPLE_RATE
+
+    key = None         # content hash when known up front (uploads); embeddings/caches key on it
+    _spool = None      # in-memory / spilled PCM owned by this source (decode_stream)
+    _borrowed = False  # view handed out by open_audio(source): closing it leaves the owner open
+
+    def __init__(self, path: str):
+        self.path = path
+        layout = _wav_layout(path)
+        if layout is None or layout[2:] != (1, 2, SAMPLE_RATE):
+            self.pcm_path = decoded_pcm_path(path)
+            layout = _wav_layout(self.pcm_path)
+        else:
+            self.pcm_path = path
+        offset, nbytes = layout[0], layout[1] // 2 * 2
+        if nbytes:
+            self.samples = np.memmap(self.pcm_path, dtype="<i2", mode="r", offset=offset, shape=(nbytes // 2,))
+        else:
+            self.samples = np.zeros(0, dtype="<i2")
+
+    @classmethod
+    def from_pcm(cls, spool: "_Spool", key: Optional[str] = None, name: str = "<stream>") -> "AudioSource":
+        """Source over 16 kHz mono int16 PCM in `spool`; close() releases the spool."""
+        source = cls.__new__(cls)
+        source.path = name
+        source.pcm_path = None
+        source.key = key
+        source._spool = spool
+        source.samples = spool.array("<i2")
+        return source
+
+    def borrow(self) -> "AudioSource":
+        """Same samples, but close() on the view doesn't close this source."""
+        view = AudioSource.__new__(AudioSource)
+        view.__dict__.update(self.__dict__)
+        view._spool = None
+        view._borrowed = True
+        return view
+
+    def __len__(self):
+        return len(self.samples)
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / float(self.sr)
+
+    def read(self, start: int, stop: int) -> np.ndarray:
+        """Samples [start, stop) as float32 in [-1, 1]."""
+        start = max(0, start)
+        stop = min(len(self.samples), stop)
+        return self.samples[start:max(start, stop)].astype(np.float32) / 32768.0
+
+    def window(self, start: float, end: float, pre_roll: float = 0.0, post_roll: float = 0.0) -> np.ndarray:
+        """Seconds [start - pre_roll, end + post_roll] as float32 (same bounds as slice_segment)."""
+        return self.read(int(round((start - pre_roll) * self.sr)), int(round((end + post_roll) * self.sr)))
+
+    def clips(self, segments: Sequence[dict], pre_roll: float = 0.0, post_roll: float = 0.0) -> "SegmentClips":
+        return SegmentClips(self, segments, pre_roll, post_roll)
+
+    def iter_blocks(self, block_sec: float) -> Iterator[np.ndarray]:
+        step = int(block_sec * self.sr)
+        for b in range(0, len(self.samples), step):
+            yield self.read(b, b + step)
+
+    def iter_windows(self, window_sec: float, search_sec: float = 5.0, frame_ms: int = 30) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        (start sample, float32 window) pairs covering the whole source, each at most
+        `window_sec` long. Every cut is moved to the quietest `frame_ms` frame within
+        the last `search_sec` of the window so words are not split between windows.
+        """
+        n = len(self.samples)
+        size = int(window_sec * self.sr)
+        frame = self.sr * frame_ms // 1000
+        start = 0
+        while start < n:
+            stop = start + size
+            if stop < n:
+                lo = max(start + frame, stop - int(search_sec * self.sr))
+                k = (stop - lo) // frame
+                if k > 0:
+                    tail = self.samples[stop - k * frame:stop].astype(np.float32).reshape(k, frame)
+                    stop = stop - k * frame + int(np.argmin((tail * tail).sum(axis=1))) * frame
+            stop = min(stop, n)
+            yield start, self.read(start, stop)
+            start = stop
+
+    def close(self):
+        mm = None if self._borrowed else getattr(self.samples, "_mmap", None)
+        self.samples = np.zeros(0, dtype="<i2")
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+        if mm is not None:
+            try:
+                mm.close()
+            except BufferError:
+                pass  # a view is still alive; the map is released when it is collected
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+class SegmentClips(Sequence):
+    """Lazy sequence of segment windows: clip i is read from the map only when indexed."""
+    def __init__(self, source: AudioSource, segments: Sequence[dict], pre_roll: float, post_roll: float):
+        self.source = source
+        self.segments = segments
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+
+    def __len__(self):
+        return len(self.segments)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        s = self.segments[i]
+        return self.source.window(s["start"], s["end"], self.pre_roll, self.post_roll)
+
+def open_audio(path) -> AudioSource:
+    """
+    Memory-mapped 16 kHz mono view of any file ffmpeg can read (PCM WAV needs no ffmpeg).
+    An AudioSource (e.g. from decode_stream) is passed through as a borrowed view, so
+    `with open_audio(src)` in a reader never closes the caller's source.
+    """
+    if isinstance(path, AudioSource):
+        return path.borrow()
+    return AudioSource(path)
+
+# --- streamed input (uploads) ------------------------------------------------------
+
+STREAM_CHUNK = 1 << 20   # bytes read from the input per step
+WAV_HEADER_PEEK = 1 << 16  # enough for the header chunks of any WAV writer we've seen
+
+class AudioTooLarge(ValueError):
+    """Input over the byte or duration limit given to decode_stream."""
+
+class DecoderUnavailable(RuntimeError):
+    """Input needs ffmpeg and it isn't installed (16 kHz mono 16-bit WAV decodes without it)."""
+
+class _Spool:
+    """
+    Write-once byte buffer: a bytearray up to `limit` bytes, then an unnamed temp file
+    (O_TMPFILE where available), which the OS deletes when it is closed or the
+    process dies. array() exposes the contents as NumPy without another copy.
+    """
+    def __init__(self, limit: int = UPLOAD_SPOOL_BYTES):
+        self.limit = limit
+        self.size = 0
+        self._buf = bytearray()
+        self._file = None
+
+    def write(self, data: bytes):
+        if self._file is None and self.size + len(data) > self.limit:
+            self.spill()
+        if self._file is not None:
+            self._file.write(data)
+        else:
+            self._buf += data
+        self.size += len(data)
+
+    def spill(self):
+        if self._file is None:
+            self._file = tempfile.TemporaryFile()
+            self._file.write(self._buf)
+            self._buf = bytearray()
+
+    def fileno(self) -> int:
+        """A real descriptor (spills first); the file is flushed and rewound."""
+        self.spill()
+        self._file.flush()
+        self._file.seek(0)
+        return self._file.fileno()
+
+    def array(self, dtype) -> np.ndarray:
+        n = self.size // np.dtype(dtype).itemsize
+        if self._file is None:
+            return np.frombuffer(self._buf, dtype=dtype, count=n)
+        self._file.flush()
+        if n == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self._file, dtype=dtype, mode="r", shape=(n,))
+
+    def truncate(self, size: int):
+        if size >= self.size:
+            return
+        if self._file is None:
+            del self._buf[size:]
+        else:
+            self._file.truncate(size)
+            self._file.seek(size)
+        self.size = size
+
+    def close(self):
+        self._buf = bytearray()  # NumPy views keep the old buffer alive until they go away
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+class _Input:
+    """The input stream, hashed and size-checked as it is read; `raw` keeps a copy when asked to."""
+    def __init__(self, stream, max_bytes: Optional[int], raw: Optional[_Spool] = None):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.raw = raw
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def read(self, n: int = STREAM_CHUNK) -> bytes:
+        data = self.stream.read(n)
+        self.size += len(data)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            raise AudioTooLarge(f"input is over {self.max_bytes} bytes")
+        self.sha256.update(data)
+        if self.raw is not None:
+            self.raw.write(data)
+        return data
+
+    def __iter__(self):
+        return iter(self.read, b"")
+
+def _copy_pcm(head: bytes, layout, inp: _Input, pcm: _Spool, max_pcm: Optional[int]):
+    """16 kHz mono int16 WAV: the data chunk is already the PCM we want."""
+    offset, nbytes = layout[0], layout[1]
+
+    def write(data):
+        pcm.write(data)
+        # bytes past the data chunk are trailing metadata, cut below; they don't count
+        size = pcm.size if nbytes is None else min(pcm.size, nbytes)
+        if max_pcm is not None and size > max_pcm:
+            raise AudioTooLarge(f"audio is over {max_pcm / (2 * SAMPLE_RATE):g} s")
+
+    write(head[offset:])
+    for block in inp:
+        if nbytes is None or pcm.size < nbytes:
+            write(block)
+    if nbytes is not None:
+        pcm.truncate(nbytes)  # trailing chunks (LIST, id3, ...) are not audio
+
+def _ffmpeg_pcm(cmd, pcm: _Spool, max_pcm: Optional[int], feed=None, pass_fds=()):
+    """Run ffmpeg writing s16le to stdout into `pcm`; `feed(stdin)` supplies the input, if piped."""
+    with tempfile.TemporaryFile() as err:
+        try:
+            proc = subprocess.Popen(cmd, stdin=subprocess.PIPE if feed else subprocess.DEVNULL,
+                                    stdout=subprocess.PIPE, stderr=err, pass_fds=pass_fds)
+        except FileNotFoundError as e:
+            raise DecoderUnavailable("ffmpeg is not installed; only 16 kHz mono 16-bit WAV can be decoded") from e
+        failed = []
+
+        def writer():
+            try:
+                feed(proc.stdin)
+            except BrokenPipeError:
+                pass  # ffmpeg gave up on the input; its exit status says why
+            except BaseException as e:
+                failed.append(e)
+                proc.kill()
+            finally:
+                try:
+                    proc.stdin.close()
+                except OSError:
+                    pass
+
+        thread = threading.Thread(target=writer, name="ffmpeg-feed", daemon=True) if feed else None
+        if thread:
+            thread.start()
+        try:
+            for block in iter(lambda: proc.stdout.read(STREAM_CHUNK), b""):
+                pcm.write(block)
+                if max_pcm is not None and pcm.size > max_pcm:
+                    raise AudioTooLarge(f"audio is over {max_pcm / (2 * SAMPLE_RATE):g} s")
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            proc.stdout.close()
+            proc.wait()
+            if thread:
+                thread.join()
+        if failed:
+            raise failed[0]
+        if proc.returncode != 0:
+            err.seek(0)
+            return err.read().decode(errors="ignore")[-500:] or f"ffmpeg exited with {proc.returncode}"
+    return None
+
+def decode_stream(stream, max_bytes: Optional[int] = None, max_sec: Optional[float] = None,
+                  spool_bytes: int = UPLOAD_SPOOL_BYTES, name: str = "<stream>") -> AudioSource:
+    """
+    Decode a readable binary stream (e.g. an upload) to a 16 kHz mono AudioSource.
+    16 kHz mono 16-bit WAV is copied as is; anything else is piped through ffmpeg.
+    The PCM stays in memory up to `spool_bytes`, then in a private temp file; close()
+    the source to release it. source.key is the sha256 of the input bytes (equal to
+    cache.audio_hash of the same file). Raises AudioTooLarge past `max_bytes` of input
+    or `max_sec` of audio, RuntimeError when the input can't be decoded
+    (DecoderUnavailable when that's because ffmpeg is missing).
+    """
+    max_pcm = None if max_sec is None else int(max_sec * SAMPLE_RATE) * 2
+    pcm = _Spool(spool_bytes)
+    raw = _Spool(spool_bytes)  # compressed input, kept only for the seekable retry below
+    inp = _Input(stream, max_bytes)
+    try:
+        with span("decode"):
+            head = inp.read(WAV_HEADER_PEEK)
+            layout = _parse_wav(io.BytesIO(head), None)
+            if layout is not None and layout[2:] == (1, 2, SAMPLE_RATE) and layout[0] <= len(head):
+                _copy_pcm(head, layout, inp, pcm, max_pcm)
+            else:
+                inp.raw = raw
+                raw.write(head)
+                cmd = ["ffmpeg", "-hide_banner", "-threads", "0", "-i", "pipe:0",
+                       "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "pipe:1"]
+
+                def feed(stdin):
+                    stdin.write(head)
+                    for block in inp:
+                        stdin.write(block)
+
+                error = _ffmpeg_pcm(cmd, pcm, max_pcm, feed=feed)
+                for _ in inp:  # rest of the input, if ffmpeg stopped reading early (hash + raw copy)
+                    pass
+                if error is not None:
+                    # containers that need seeking (MP4/M4A with the index at the end) can't be
+                    # read from a pipe: decode the received bytes again from the private temp file
+                    fd = raw.fileno()
+                    pcm.truncate(0)
+                    cmd[cmd.index("pipe:0")] = f"/dev/fd/{fd}"
+                    error = _ffmpeg_pcm(cmd, pcm, max_pcm, pass_fds=(fd,))
+                if error is not None:
+                    raise RuntimeError(f"Failed to decode audio: {error}")
+    except BaseException:
+        pcm.close()
+        raise
+    finally:
+        raw.close()
+    return AudioSource.from_pcm(pcm, key=inp.sha256.hexdigest(), name=name)
@@ -0,0 +1,188 @@
+# backend/cache.py
+"""
+Content-addressed result cache for ASR / VAD / pipeline output.
+
+Keys are sha256(audio bytes) + stage name + every parameter that changes the
+output (model, language, decode options, ...), so the same recording uploaded
+under any name by anyone hits the same entry. Entries are JSON files under
+CACHE_DIR; the total size is bounded with least-recently-used eviction (file
+mtime is bumped on every hit).
+
+Env:
+  SONICLENS_CACHE_DIR      where entries live (default data/cache)
+  SONICLENS_CACHE_MAX_MB   size budget (default 512)
+  SONICLENS_CACHE=0        disable
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Any, Callable, Optional
+
+CACHE_DIR = os.environ.get("SONICLENS_CACHE_DIR", "data/cache")
+CACHE_MAX_BYTES = int(float(os.environ.get("SONICLENS_CACHE_MAX_MB", "512")) * 1024 * 1024)
+CACHE_ENABLED = os.environ.get("SONICLENS_CACHE", "1") != "0"
+
+_HASH_MEMO = {}  # (path, size, mtime) -> sha256, so a file is hashed once
+
+def audio_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    digest = _HASH_MEMO.get(memo_key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(chunk_size), b""):
+                h.update(block)
+        digest = _HASH_MEMO[memo_key] = h.hexdigest()
+    return digest
+
+class ResultCache:
+    def __init__(self, root: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES, enabled: bool = CACHE_ENABLED):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._bytes = None  # computed lazily from disk
+
+    @staticmethod
+    def make_key(audio_key: str, kind: str, params: dict) -> str:
+        blob = json.dumps({"audio": audio_key, "kind": kind, "params": params}, sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + ".json")
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)  # LRU: mark as recently used
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)  # atomic: readers never see half an entry
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = self._disk_usage()
+            else:
+                self._bytes += len(data)
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def get_or_compute(self, audio_path: str, kind: str, params: dict, fn: Callable[[], Any],
+                       audio_key: Optional[str] = None, store_if: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Return the cached result for (audio content, kind, params) or compute + store it.
+        Exceptions from fn are not cached; `store_if(value)` can veto storing a result.
+        """
+        if not self.enabled:
+            return fn()
+        key = self.make_key(audio_key or audio_hash(audio_path), kind, params)
+        value = self.get(key)
+        if value is None:
+            value = fn()
+            if store_if is None or store_if(value):
+                self.put(key, value)
+        return value
+
+    def _entries(self):
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    yield st.st_mtime, st.st_size, path
+
+    def _disk_usage(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        # oldest first until we're back under 90% of the budget (caller holds the lock)
+        target = int(self.max_bytes * 0.9)
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._bytes = total
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+results = ResultCache()
+
+# --- cached entry points -------------------------------------------------------
+# `path` may also be an open AudioSource (a decoded upload); pass its .key as audio_key.
+
+def cached_transcribe_file(path: str, language: str = "en", model_name: str = "small",
+                           device: Optional[str] = None, audio_key: Optional[str] = None) -> str:
+    from backend.asr.asr_whisper import transcribe_file
+    from backend.asr.whisper_options import model_tag, DECODE_OPTIONS
+    params = {"model": model_tag(model_name, device), "language": language, "decode": DECODE_OPTIONS}
+    return results.get_or_compute(path, "transcribe", params,
+                                  lambda: transcribe_file(path, language=language, model_name=model_name, device=device),
+                                  audio_key=audio_key)
+
+def cached_transcribe_speech_only(path: str, language: str = "en", model_name: str = "small",
+                                  device: Optional[str] = None, audio_key: Optional[str] = None) -> dict:
+    from backend.asr import speech_only
+    from backend.asr.whisper_options import model_tag, DECODE_OPTIONS
+    audio_key = audio_key or audio_hash(path)
+    params = {"model": model_tag(model_name, device), "language": language, "decode": DECODE_OPTIONS,
+              "pad": speech_only.REGION_PAD_SEC, "gap": speech_only.JOIN_GAP_SEC, "window": speech_only.WINDOW_SEC}
+    def run():
+        segments = cached_vad_segments(path, audio_key=audio_key)  # VAD result is shared with /diarize
+        return speech_only.transcribe_speech_only(path, language=language, model_name=model_name,
+                                                  device=device, segments=segments)
+    return results.get_or_compute(path, "transcribe_speech_only", params, run, audio_key=audio_key)
+
+def cached_vad_segments(path: str, audio_key: Optional[str] = None):
+    from backend.diarization import diarize, embeddings
+    # fallback (alternating) speaker labels get their own entry, replaced once the encoder works
+    params = {"frame_ms": diarize.FRAME_MS, "gate_dbfs": diarize.ENERGY_GATE_DBFS,
+              "cluster_threshold": embeddings.CLUSTER_THRESHOLD, "max_speakers": embeddings.MAX_SPEAKERS,
+              "speaker_embeddings": embeddings.encoder_available()}
+    return results.get_or_compute(path, "diarize", params,
+                                  lambda: diarize.simple_vad_segments(path), audio_key=audio_key)
+
+def cached_diarize_and_transcribe(path: str, language: str = "en", audio_key: Optional[str] = None, **kwargs):
+    from backend import pipeline
+    params = pipeline.run_params(language, kwargs.get("pack", pipeline.PACK_SEGMENTS))
+    return results.get_or_compute(path, "pipeline", params,
+                                  lambda: pipeline.diarize_and_transcribe(path, language=language, **kwargs),
+                                  audio_key=audio_key,
+                                  store_if=lambda segs: not any(s["text"].startswith("[ASR error") for s in segs))
@@ -0,0 +1,68 @@
+# backend/captions.py
+"""
+Fan-out of live captions to any number of subscribers (SSE / WebSocket clients).
+
+The live pipeline publishes from its consumer thread; every subscriber gets its
+own bounded asyncio.Queue on the server's event loop. A slow client drops its
+oldest captions instead of holding up the producer or the other clients.
+"""
+import asyncio
+import json
+import threading
+from typing import Optional
+
+SUBSCRIBER_QUEUE = 64
+
+class CaptionHub:
+    def __init__(self, max_queue: int = SUBSCRIBER_QUEUE):
+        self.max_queue = max_queue
+        self.latest: Optional[dict] = None
+        self._subs = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """Attach the event loop subscribers live on (call from inside the loop)."""
+        self._loop = loop
+
+    def publish(self, caption: dict):
+        """Thread-safe: may be called from the live pipeline's consumer thread."""
+        if caption.get("type", "final") == "final":
+            with self._lock:
+                self.latest = caption
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._fanout, caption)
+
+    def _fanout(self, caption: dict):
+        for q in list(self._subs):
+            if q.full():
+                q.get_nowait()  # drop oldest for slow clients
+            q.put_nowait(caption)
+
+    def subscribe(self) -> asyncio.Queue:
+        q = asyncio.Queue(maxsize=self.max_queue)
+        self._subs.add(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue):
+        self._subs.discard(q)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subs)
+
+    async def sse_events(self, heartbeat: float = 15.0):
+        """Async generator of Server-Sent Events frames for one client."""
+        q = self.subscribe()
+        try:
+            if self.latest is not None:
+                yield f"event: final\ndata: {json.dumps(self.latest)}\n\n"
+            while True:
+                try:
+                    cap = await asyncio.wait_for(q.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {cap.get('type', 'final')}\ndata: {json.dumps(cap)}\n\n"
+        finally:
+            self.unsubscribe(q)
@@ -1,52 +1,158 @@
 # backend/cleanup.py
 """
-Cleans raw pipeline JSON:
-- removes empty text segments
-- merges adjacent segments from same speaker with small gaps
-- basic text normalization (remove weird chars, collapse whitespace, capitalize)
+Cleans raw pipeline JSON (the one cleanup engine used by every CLI and the live pipeline):
+- strips garbage characters and collapses whitespace
+- merges adjacent segments from same speaker with small gaps (and very short
+  cross-speaker fragments separated by tiny gaps)
+- sentence-case normalization, drops tiny empty segments
+
+CleanupEngine consumes segments in start order and hands back each merged segment
+as soon as no later segment can still join it, so it works on streams as well as
+whole files. Text is collected as parts and joined once per merged segment, and
+all patterns are compiled once, so the whole pass is linear in transcript length.
+clean_transcript() runs it over an array-backed Transcript (backend.transcript),
+which is already in start order, so nothing is re-sorted or copied up front.
+
 Usage:
-    python backend/cleanup.py raw.json > polished.json
+    python backend/cleanup.py raw.json > polished.json      (raw.jsonl from a streamed run works too)
 """
 import sys, json, re
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# parameters you can tune
+MIN_TEXT_LEN = 1            # minimum non-space chars to keep
+MIN_SEGMENT_DURATION = 0.15 # seconds; drop empty segments shorter than this after merging
+MAX_GAP_TO_MERGE = 0.5      # seconds; if gap between segments <= this and same speaker -> merge
+MAX_SHORT_GAP_MERGE = 0.3   # merge across small gaps even if different speaker, when one side is short
+SHORT_SEGMENT = 1.0         # seconds; "short" for the cross-speaker rule
+
+_GARBAGE = re.compile(r"[^\x09\x0A\x0D\x20-\x7E\u00A0-\uFFFF]+")
+_WS = re.compile(r"\s+")
+_SPACE_BEFORE_PUNCT = re.compile(r"\s+([?.!,])")
+_REPEAT_PUNCT = re.compile(r"([,.!?]){2,}")
+_SENTENCE_SPLIT = re.compile(r"([.!?]\s*)")
 
 def clean_text(s):
     if not s:
         return ""
     # remove non-UTF-8-like garbage, keep basic punctuation
-    s = re.sub(r"[^\x09\x0A\x0D\x20-\x7E\u00A0-\uFFFF]+", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    s = re.sub(r"\s+([?.!,])", r"\1", s)
-    if s:
-        s = s[0].upper() + s[1:]
+    s = _GARBAGE.sub(" ", s)
+    s = _WS.sub(" ", s).strip()
+    s = _SPACE_BEFORE_PUNCT.sub(r"\1", s)
     return s
 
-def merge_segments(segments, max_gap=0.5):
-    # segments: list of dicts sorted by start
-    segs = sorted(segments, key=lambda x: x.get("start",0))
-    # clean text
-    for s in segs:
-        s["text"] = clean_text(s.get("text",""))
-    # drop empties
-    segs = [s for s in segs if s["text"].strip() != ""]
-    if not segs:
-        print("[]")
-        return
-    out = [segs[0].copy()]
-    for s in segs[1:]:
-        cur = out[-1]
-        same_speaker = (s.get("speaker") == cur.get("speaker"))
-        gap = s.get("start",0) - cur.get("end",0)
-        if same_speaker and gap <= max_gap:
-            # merge
-            cur["end"] = s["end"]
-            cur["text"] = (cur["text"] + " " + s["text"]).strip()
-        else:
-            out.append(s.copy())
-    print(json.dumps(out, indent=2, ensure_ascii=False))
+def normalize_text(t: str) -> str:
+    t = t.strip()
+    if not t:
+        return ""
+    t = _WS.sub(" ", t)
+    # fix repeated punctuation
+    t = _REPEAT_PUNCT.sub(r"\1", t)
+    # naive sentence capitalization: lower everything, upper first char of each sentence
+    t = t.lower()
+    sentences = _SENTENCE_SPLIT.split(t)
+    out = []
+    for i in range(0, len(sentences), 2):
+        s = sentences[i].strip()
+        if s:
+            s = s[0].upper() + s[1:]
+        out.append(s)
+        if i + 1 < len(sentences):
+            out.append(sentences[i + 1])
+    t = "".join(out).strip()
+    # ensure ending punctuation
+    if t and t[-1] not in ".!?":
+        t += "."
+    return t
+
+class CleanupEngine:
+    """
+    Incremental merge/normalize. feed() segments in start order; every call returns
+    the merged segments that became final. advance(t) finalizes the open segment once
+    stream time `t` is past any merge window; close() flushes the rest.
+    """
+    def __init__(self, max_gap: float = MAX_GAP_TO_MERGE, max_short_gap: Optional[float] = MAX_SHORT_GAP_MERGE,
+                 short_segment: float = SHORT_SEGMENT, min_text_len: int = MIN_TEXT_LEN,
+                 min_duration: float = MIN_SEGMENT_DURATION):
+        self.max_gap = max_gap
+        self.max_short_gap = max_short_gap
+        self.short_segment = short_segment
+        self.min_text_len = min_text_len
+        self.min_duration = min_duration
+        self._cur = None
+        self._parts = []
+
+    def _open(self, seg):
+        self._cur = dict(seg)
+        text = clean_text(seg.get("text", ""))
+        self._parts = [text] if text else []
+
+    def _can_merge(self, s) -> bool:
+        cur = self._cur
+        gap = s["start"] - cur["end"]
+        # if same speaker and gap small => merge
+        if s.get("speaker") == cur.get("speaker") and gap <= self.max_gap:
+            return True
+        # if different speaker but very small gap and either side short => merge (keep the earlier speaker)
+        return (self.max_short_gap is not None and gap <= self.max_short_gap
+                and (cur["end"] - cur["start"] < self.short_segment or s["end"] - s["start"] < self.short_segment))
+
+    def _finish(self) -> List[Dict]:
+        seg, self._cur = self._cur, None
+        seg["text"] = normalize_text(" ".join(self._parts))
+        self._parts = []
+        if len(seg["text"]) < self.min_text_len and seg["end"] - seg["start"] < self.min_duration:
+            return []  # drop
+        return [seg]
+
+    def feed(self, seg: Dict) -> List[Dict]:
+        if self._cur is None:
+            self._open(seg)
+            return []
+        if self._can_merge(seg):
+            self._cur["end"] = max(self._cur["end"], seg["end"])
+            text = clean_text(seg.get("text", ""))
+            if text:
+                self._parts.append(text)
+            return []
+        done = self._finish()
+        self._open(seg)
+        return done
+
+    def advance(self, t: float) -> List[Dict]:
+        """No segment will start before `t`: finalize the open one if nothing can join it anymore."""
+        if self._cur is None:
+            return []
+        horizon = max(self.max_gap, self.max_short_gap or 0.0)
+        if t - self._cur["end"] > horizon:
+            return self._finish()
+        return []
+
+    def close(self) -> List[Dict]:
+        return self._finish() if self._cur is not None else []
+
+def clean_stream(segments: Iterable[Dict], **rules) -> Iterator[Dict]:
+    """Generator form: yields merged, normalized segments as they become final (input in start order)."""
+    engine = CleanupEngine(**rules)
+    for seg in segments:
+        yield from engine.feed(seg)
+    yield from engine.close()
+
+def merge_segments(segments: List[Dict], **rules) -> List[Dict]:
+    """Batch form: sorts by start (a Transcript already is), then runs the streaming engine."""
+    from backend.transcript import Transcript
+    if not isinstance(segments, Transcript):
+        segments = sorted(segments, key=lambda x: x.get("start", 0))
+    return list(clean_stream(segments, **rules))
+
+def clean_transcript(transcript, **rules):
+    """Transcript -> cleaned Transcript; merged segments go straight into the new columns."""
+    from backend.transcript import Transcript
+    return Transcript.from_segments(clean_stream(transcript, **rules))
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Usage: python backend/cleanup.py raw.json")
         sys.exit(1)
-    data = json.load(open(sys.argv[1], encoding="utf-8"))
-    merge_segments(data)
+    from backend.transcript import Transcript
+    print(json.dumps(clean_transcript(Transcript.read(sys.argv[1])).to_segments(), indent=2, ensure_ascii=False))
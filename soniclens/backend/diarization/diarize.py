@@ -1,36 +1,156 @@
-import sys, contextlib, wave
+import os, sys, contextlib, wave
+import numpy as np
 import webrtcvad
 
-def simple_vad_segments(path):
-    with contextlib.closing(wave.open(path, "rb")) as wf:
-        if wf.getnchannels() != 1:
-            raise Exception("Please provide mono WAV for demo diarization.")
+from backend.metrics import span
+
+VAD_RATE = 16000          # all input is brought to 16 kHz mono before VAD
+FRAME_MS = 30             # webrtcvad accepts 10/20/30 ms frames
+BLOCK_SEC = 30            # read this much audio per block; memory stays constant
+ENERGY_GATE_DBFS = -60.0  # frames quieter than this are silence without asking webrtcvad
+
+def _decode_frames(raw, sampwidth, channels):
+    """Raw PCM bytes -> float32 mono in [-1, 1] (multi-channel input is downmixed)."""
+    if sampwidth == 1:
+        x = (np.frombuffer(raw, np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sampwidth == 2:
+        x = np.frombuffer(raw, "<i2").astype(np.float32) / 32768.0
+    elif sampwidth == 3:
+        b = np.frombuffer(raw, np.uint8).reshape(-1, 3).astype(np.int32)
+        v = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+        v = np.where(v >= 1 << 23, v - (1 << 24), v)
+        x = v.astype(np.float32) / float(1 << 23)
+    elif sampwidth == 4:
+        x = np.frombuffer(raw, "<i4").astype(np.float32) / float(1 << 31)
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {sampwidth} bytes")
+    if channels > 1:
+        x = x.reshape(-1, channels).mean(axis=1)
+    return x
+
+class _StreamResampler:
+    """
+    Linear-interpolation resampler that keeps phase across blocks.
+    Good enough for VAD decisions; not meant for ASR-quality audio.
+    """
+    def __init__(self, sr_in, sr_out):
+        self.step = sr_in / float(sr_out)
+        self.pos = 0.0  # next output position, in input samples relative to `tail`
+        self.tail = np.zeros(0, np.float32)
+
+    def __call__(self, x):
+        buf = np.concatenate([self.tail, x])
+        last = len(buf) - 1
+        if last < self.pos:
+            self.tail = buf
+            return np.zeros(0, np.float32)
+        n_out = int((last - self.pos) // self.step) + 1
+        t = self.pos + self.step * np.arange(n_out)
+        y = np.interp(t, np.arange(len(buf)), buf).astype(np.float32)
+        next_pos = self.pos + self.step * n_out
+        keep = min(int(next_pos), last)
+        self.tail = buf[keep:]
+        self.pos = next_pos - keep
+        return y
+
+def iter_pcm_blocks(path, block_sec=BLOCK_SEC):
+    """
+    Yield 16 kHz mono float32 blocks of a PCM WAV, whatever its rate/channels/width.
+    Other formats go through the memory-mapped decoded-once copy (backend.audio.open_audio),
+    and so does an already open AudioSource (e.g. a decoded upload).
+    """
+    try:
+        if not isinstance(path, (str, os.PathLike)):
+            raise wave.Error("not a path")
+        wf = wave.open(path, "rb")
+    except (wave.Error, EOFError):
+        from backend.audio import open_audio
+        with open_audio(path) as source:
+            yield from source.iter_blocks(block_sec)
+        return
+    with contextlib.closing(wf):
+        channels = wf.getnchannels()
+        sampwidth = wf.getsampwidth()
         sample_rate = wf.getframerate()
-        pcm = wf.readframes(wf.getnframes())
-    vad = webrtcvad.Vad(3)
-    frame_duration = 30  # ms
-    bytes_per_frame = int(sample_rate * (frame_duration/1000.0) * 2)  # 16-bit
-    segments = []
+        resample = _StreamResampler(sample_rate, VAD_RATE) if sample_rate != VAD_RATE else None
+        frames_per_block = int(sample_rate * block_sec)
+        while True:
+            raw = wf.readframes(frames_per_block)
+            if not raw:
+                break
+            x = _decode_frames(raw, sampwidth, channels)
+            yield resample(x) if resample else x
+
+def iter_vad_segments(path, aggressiveness=3, energy_gate_dbfs=ENERGY_GATE_DBFS, block_sec=BLOCK_SEC):
+    """
+    Streaming VAD: reads `path` block by block and yields {"start", "end"} dicts (seconds)
+    as soon as each speech region closes. A vectorized RMS gate marks clearly silent
+    frames so webrtcvad only runs on frames with some energy.
+    """
+    vad = webrtcvad.Vad(aggressiveness)
+    frame_len = VAD_RATE * FRAME_MS // 1000
+    frame_sec = FRAME_MS / 1000.0
+    gate = 10.0 ** (energy_gate_dbfs / 20.0)
+    carry = np.zeros(0, np.float32)
+    n_frames_seen = 0
+    n_samples = 0
     inside = False
     start_time = 0.0
-    for i in range(0, len(pcm), bytes_per_frame):
-        chunk = pcm[i:i+bytes_per_frame]
-        if len(chunk) < bytes_per_frame:
-            break
-        t = i / (sample_rate*2)
-        is_speech = vad.is_speech(chunk, sample_rate)
-        if is_speech and not inside:
-            inside = True
-            start_time = t
-        elif not is_speech and inside:
-            inside = False
-            segments.append((start_time, t))
+    for block in iter_pcm_blocks(path, block_sec):
+        n_samples += len(block)
+        buf = np.concatenate([carry, block]) if len(carry) else block
+        n = len(buf) // frame_len
+        carry = buf[n * frame_len:]
+        if n == 0:
+            continue
+        frames = buf[:n * frame_len].reshape(n, frame_len)
+        loud = np.flatnonzero(np.sqrt(np.mean(frames * frames, axis=1)) >= gate)
+        pcm = np.clip(frames[loud] * 32768.0, -32768, 32767).astype("<i2")
+        speech = np.zeros(n, dtype=bool)
+        for k, j in enumerate(loud):
+            speech[j] = vad.is_speech(pcm[k].tobytes(), VAD_RATE)
+        # only state changes matter; find them without walking every frame
+        edges = np.flatnonzero(np.diff(np.concatenate(([inside], speech)).astype(np.int8)))
+        for j in edges:
+            t = float(n_frames_seen + j) * frame_sec
+            if speech[j]:
+                start_time = t
+            else:
+                yield {"start": start_time, "end": t}
+        if len(edges):
+            inside = bool(speech[-1])
+        n_frames_seen += n
     if inside:
-        segments.append((start_time, len(pcm)/(sample_rate*2)))
-    results = []
-    for i,(s,e) in enumerate(segments):
-        results.append({"speaker": f"S{i%2+1}", "start": s, "end": e})
-    return results
+        yield {"start": start_time, "end": n_samples / float(VAD_RATE)}
+
+def label_speakers(path, segments):
+    """
+    Speaker ids per segment from resemblyzer embeddings + clustering.
+    Falls back to alternating S1/S2 when the embedding stack isn't installed or
+    the encoder can't be loaded or run (the latter with a warning).
+    """
+    from backend.diarization.embeddings import get_encoder, get_embeddings_for_wav_segments, cluster_speakers
+    fallback = [f"S{i%2+1}" for i in range(len(segments))]
+    try:
+        get_encoder()
+    except Exception as e:
+        if not isinstance(e, ImportError):
+            print(f"[WARN] speaker embeddings unavailable, alternating labels: {e}")
+        return fallback
+    try:
+        with span("speaker_embedding"):
+            labels = cluster_speakers(get_embeddings_for_wav_segments(path, segments))
+    except Exception as e:
+        print(f"[WARN] speaker embedding failed, alternating labels: {e}")
+        return fallback
+    return [f"S{int(l)+1}" for l in labels]
+
+def simple_vad_segments(path):
+    with span("vad"):
+        segments = list(iter_vad_segments(path))
+    speakers = label_speakers(path, segments)
+    return [{"speaker": spk, "start": seg["start"], "end": seg["end"]}
+            for spk, seg in zip(speakers, segments)]
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -1,8 +1,7 @@
 # backend/diarization/diarize_and_transcribe.py
 import json
-import os
 import subprocess
-import tempfile
+import time
 from typing import List, Dict
 
 # try importing diarizer
@@ -30,58 +29,84 @@ def diarize_audio(path: str):
     else:
         return run_diarize_via_script(path)
 
-def extract_clip(source: str, start: float, duration: float, dst: str):
-    cmd = [
-        "ffmpeg", "-y", "-i", source,
-        "-ss", str(start), "-t", str(duration),
-        "-ac", "1", "-ar", "16000", "-sample_fmt", "s16",
-        dst
-    ]
-    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+# small margins around each segment (seconds)
+PRE_ROLL = 0.08
+POST_ROLL = 0.08
 
-def transcribe_segments(source_wav: str, out_json: str, model_name="small", device=None):
-    from backend.asr.asr_whisper import transcribe_file
-    segs = diarize_audio(source_wav)
-    out = []
-    tmpdir = tempfile.mkdtemp(prefix="clip_")
-    for i, s in enumerate(segs):
-        start = max(0.0, s["start"] - 0.08)  # small pre-roll
-        duration = (s["end"] - s["start"]) + 0.16
-        clip = os.path.join(tmpdir, f"seg_{i}.wav")
-        extract_clip(source_wav, start, duration, clip)
-        try:
-            txt = transcribe_file(clip, model_name=model_name, device=device)
-        except Exception as e:
-            txt = ""
-            print("Transcription error for clip", i, e)
-        out.append({
-            "speaker": s.get("speaker", f"S{i+1}"),
-            "start": s["start"],
-            "end": s["end"],
-            "text": txt
-        })
-    # cleanup clips
-    try:
-        import shutil
-        shutil.rmtree(tmpdir)
-    except Exception:
-        pass
-    with open(out_json, "w", encoding="utf-8") as f:
-        json.dump(out, f, ensure_ascii=False, indent=2)
+def iter_transcribed_segments(source_wav: str, segs: List[Dict], model_name="small", device=None, batch_size=8,
+                              mark_errors=False):
+    """
+    Yield lists of finished {"speaker", "start", "end", "text"} entries, one list per ASR batch.
+    A failed batch gets empty texts, or "[ASR error: ...]" with mark_errors (so a resume retries it).
+    """
+    from backend.asr.asr_whisper import transcribe_batch
+    from backend.audio import open_audio
+    if not segs:
+        return
+    # memory-mapped once; only the current batch of clips is read into RAM
+    with open_audio(source_wav) as source:
+        for b in range(0, len(segs), batch_size):
+            batch = segs[b:b + batch_size]
+            clips = source.clips(batch, PRE_ROLL, POST_ROLL)[:]
+            try:
+                texts = transcribe_batch(clips, model_name=model_name, device=device, batch_size=batch_size)
+            except Exception as e:
+                texts = [f"[ASR error: {e}]" if mark_errors else ""] * len(clips)
+                print("Transcription error for batch", e)
+            yield [{"speaker": s["speaker"], "start": s["start"], "end": s["end"], "text": txt}
+                   for s, txt in zip(batch, texts)]
+
+def transcribe_segments(source_wav: str, out_json: str, model_name="small", device=None, batch_size=8, resume=False):
+    """
+    Writes a JSON list, or -- when out_json ends with .jsonl -- appends every batch as
+    it finishes, with a checkpoint at out_json + ".ckpt" (backend.transcript_io).
+    resume=True continues a streamed run, skipping segments already written.
+    Either way the segments are added to the search index (backend.search).
+    """
+    from backend import search
+    from backend.audio import audio_duration
+    from backend.metrics import observe_audio
+    from backend.transcript_io import SegmentWriter, is_jsonl
+    t0 = time.perf_counter()
+    segs = [dict(s, speaker=s.get("speaker", f"S{i+1}")) for i, s in enumerate(diarize_audio(source_wav))]
+    if is_jsonl(out_json):
+        from backend.asr.whisper_options import model_tag
+        params = {"model": model_tag(model_name, device), "pre_roll": PRE_ROLL, "post_roll": POST_ROLL}
+        with SegmentWriter(out_json, source_wav, params, resume=resume,
+                           meeting=search.meeting_name(out_json)) as writer:
+            todo = [s for s in segs if not writer.is_done(s)]
+            writer.set_total(len(segs))
+            if resume:
+                print(f"Resuming: {len(segs) - len(todo)} of {len(segs)} segments already done")
+            for batch in iter_transcribed_segments(source_wav, todo, model_name, device, batch_size, mark_errors=True):
+                writer.write(batch)
+        out = None
+    else:
+        out = []
+        for batch in iter_transcribed_segments(source_wav, segs, model_name, device, batch_size):
+            out.extend(batch)
+        with open(out_json, "w", encoding="utf-8") as f:
+            json.dump(out, f, ensure_ascii=False, indent=2)
+        if search.SEARCH_ENABLED:
+            search.index.index_meeting(search.meeting_name(out_json), out)
+    observe_audio("pipeline", audio_duration(source_wav), time.perf_counter() - t0)
     print("Wrote:", out_json)
     return out
 
 if __name__ == "__main__":
     import sys
     if len(sys.argv) < 3:
-        print("Usage: python diarize_and_transcribe.py input.wav output.json [--model MODEL] [--device cpu|mps|cuda]")
+        print("Usage: python diarize_and_transcribe.py input.wav output.json|output.jsonl [--model MODEL] [--device cpu|cpu-int8|mps|cuda] [--batch-size N] [--resume]")
         sys.exit(1)
     src = sys.argv[1]
     dest = sys.argv[2]
     model = "small"
     device = None
+    batch_size = 8
     if "--model" in sys.argv:
         model = sys.argv[sys.argv.index("--model")+1]
     if "--device" in sys.argv:
         device = sys.argv[sys.argv.index("--device")+1]
-    transcribe_segments(src, dest, model_name=model, device=device)
+    if "--batch-size" in sys.argv:
+        batch_size = int(sys.argv[sys.argv.index("--batch-size")+1])
+    transcribe_segments(src, dest, model_name=model, device=device, batch_size=batch_size, resume="--resume" in sys.argv)
@@ -1,4 +1,176 @@
-# Placeholder embeddings helper — returns dummy vectors for MVP
-def get_embeddings_for_wav_segments(wav_path, segments):
-    import numpy as np
-    return np.random.rand(len(segments), 256)
+# backend/diarization/embeddings.py
+"""
+Speaker embeddings (resemblyzer d-vectors) and speaker clustering.
+
+Segments are read from a memory-mapped source (backend.audio.open_audio), split
+into the encoder's partial windows and pushed through the network in large
+batches; only one batch of mels is held at a time.
+Embeddings are cached per (content hash, segment) so re-diarizing the same file is free.
+"""
+from collections import OrderedDict
+import numpy as np
+
+EMBED_DIM = 256
+PARTIALS_PER_BATCH = 256     # partial mel windows per forward pass
+CACHE_MAX_ITEMS = 50000      # cached segment embeddings (LRU)
+CLUSTER_THRESHOLD = 0.75     # cosine similarity needed to join an existing speaker
+MAX_SPEAKERS = 8
+
+_ENCODER = None
+_CACHE = OrderedDict()
+
+def get_encoder(device=None):
+    global _ENCODER
+    if _ENCODER is None:
+        from resemblyzer import VoiceEncoder
+        _ENCODER = VoiceEncoder(device=device or "cpu", verbose=False)
+    return _ENCODER
+
+def encoder_available() -> bool:
+    """Whether the encoder loads here; without it speakers are only alternating guesses."""
+    try:
+        get_encoder()
+        return True
+    except Exception:
+        return False
+
+def _cache_key(key, seg):
+    return (key, round(float(seg["start"]), 3), round(float(seg["end"]), 3))
+
+def embed_segments(audio, segments, key=None, batch_size=PARTIALS_PER_BATCH):
+    """
+    audio: 16 kHz mono float32 buffer or an AudioSource; segments: dicts with start/end (seconds).
+    Returns an (n, EMBED_DIM) array of L2-normalized embeddings, same as
+    VoiceEncoder.embed_utterance would give for each segment.
+    """
+    import torch
+    from resemblyzer.audio import wav_to_mel_spectrogram, normalize_volume
+    from backend.audio import slice_segment
+
+    out = np.zeros((len(segments), EMBED_DIM), dtype=np.float32)
+    todo = []
+    for i, seg in enumerate(segments):
+        ck = _cache_key(key, seg) if key is not None else None
+        if ck is not None and ck in _CACHE:
+            _CACHE.move_to_end(ck)
+            out[i] = _CACHE[ck]
+        else:
+            todo.append(i)
+    if not todo:
+        return out
+
+    encoder = get_encoder()
+    sums = np.zeros_like(out)
+    mels, owner = [], []
+
+    def flush():
+        # sum of partial embeddings per segment; memory stays at one batch of mels
+        batch = torch.from_numpy(np.stack(mels)).to(encoder.device)
+        with torch.no_grad():
+            np.add.at(sums, np.asarray(owner), encoder(batch).cpu().numpy())
+        mels.clear()
+        owner.clear()
+
+    for i in todo:
+        wav = normalize_volume(slice_segment(audio, segments[i]["start"], segments[i]["end"]), -30, increase_only=True)
+        wav_slices, mel_slices = encoder.compute_partial_slices(len(wav))
+        max_len = wav_slices[-1].stop
+        if max_len >= len(wav):
+            wav = np.pad(wav, (0, max_len - len(wav)), "constant")
+        mel = wav_to_mel_spectrogram(wav)
+        mels.extend(mel[s] for s in mel_slices)
+        owner.extend([i] * len(mel_slices))
+        if len(mels) >= batch_size:
+            flush()
+    if mels:
+        flush()
+
+    # mean of partial embeddings per segment, then L2-normalize
+    norms = np.linalg.norm(sums[todo], axis=1, keepdims=True)
+    out[todo] = sums[todo] / np.maximum(norms, 1e-8)
+
+    if key is not None:
+        for i in todo:
+            _CACHE[_cache_key(key, segments[i])] = out[i]
+        while len(_CACHE) > CACHE_MAX_ITEMS:
+            _CACHE.popitem(last=False)
+    return out
+
+def get_embeddings_for_wav_segments(wav_path, segments, audio=None):
+    """
+    Memory-map `wav_path` (unless `audio` is given) and embed every segment.
+    `wav_path` may also be an open AudioSource; its content key replaces the file hash.
+    """
+    from backend.audio import open_audio
+    from backend.cache import audio_hash
+    get_encoder()  # fail fast (ImportError) before decoding if resemblyzer is missing
+    key = getattr(wav_path, "key", None) or audio_hash(wav_path)  # memoized, shared with the result cache
+    if audio is None:
+        with open_audio(wav_path) as source:
+            return embed_segments(source, segments, key=key)
+    return embed_segments(audio, segments, key=key)
+
+class OnlineClusterer:
+    """
+    Streaming counterpart of cluster_speakers: the same leader rule (join the most
+    similar speaker if cosine >= threshold, else start a new one), but centroids are
+    running means and every label is final as soon as add() returns.
+    """
+    def __init__(self, threshold=CLUSTER_THRESHOLD, max_speakers=MAX_SPEAKERS):
+        self.threshold = threshold
+        self.max_speakers = max_speakers
+        self._sums = np.zeros((max_speakers, EMBED_DIM), dtype=np.float32)
+        self._centroids = np.zeros((max_speakers, EMBED_DIM), dtype=np.float32)
+        self.k = 0
+
+    def add(self, x) -> int:
+        x = np.asarray(x, dtype=np.float32)
+        if self.k:
+            sims = self._centroids[:self.k] @ x
+            j = int(np.argmax(sims))
+        if self.k == 0 or (sims[j] < self.threshold and self.k < self.max_speakers):
+            j = self.k
+            self.k += 1
+        self._sums[j] += x
+        self._centroids[j] = self._sums[j] / max(float(np.linalg.norm(self._sums[j])), 1e-8)
+        return j
+
+def cluster_speakers(embeddings, threshold=CLUSTER_THRESHOLD, max_speakers=MAX_SPEAKERS, n_iter=10):
+    """
+    Cluster L2-normalized embeddings into speakers; returns an int label per row,
+    numbered in order of first appearance. A leader pass seeds centroids (cost O(n*k),
+    never O(n^2)), then a few vectorized spherical k-means steps refine them.
+    """
+    n = len(embeddings)
+    if n == 0:
+        return np.zeros(0, dtype=int)
+    X = np.asarray(embeddings, dtype=np.float32)
+    C = np.empty((max_speakers, X.shape[1]), dtype=np.float32)
+    C[0] = X[0]
+    k = 1
+    for x in X[1:]:
+        if k == max_speakers:
+            break
+        if float(np.max(C[:k] @ x)) < threshold:
+            C[k] = x
+            k += 1
+    C = C[:k]
+
+    labels = np.argmax(X @ C.T, axis=1)
+    for _ in range(n_iter):
+        sums = np.zeros_like(C)
+        np.add.at(sums, labels, X)
+        used = np.bincount(labels, minlength=len(C)) > 0
+        C = sums[used]
+        C /= np.maximum(np.linalg.norm(C, axis=1, keepdims=True), 1e-8)
+        new_labels = np.argmax(X @ C.T, axis=1)
+        if np.array_equal(new_labels, labels) and used.all():
+            break
+        labels = new_labels
+
+    # renumber by first appearance so the first speaker is always S1
+    _, first = np.unique(labels, return_index=True)
+    order = np.argsort(np.argsort(first))
+    remap = np.empty(labels.max() + 1, dtype=int)
+    remap[np.unique(labels)] = order
+    return remap[labels]
@@ -0,0 +1,125 @@
+# backend/jobs.py
+"""
+Background jobs for long ASR / diarization requests.
+
+Work runs on a bounded thread pool (torch and webrtcvad release the GIL for the
+heavy parts) so the event loop stays free. Queued + running jobs are capped; past
+the cap submit() raises QueueFull and the API answers 429. reserve() claims a slot
+ahead of time, so a request can be turned away before it pays for decoding its upload.
+
+Env:
+  SONICLENS_JOB_WORKERS   concurrent jobs (default 2)
+  SONICLENS_JOB_QUEUE     jobs allowed to wait for a worker (default 16)
+  SONICLENS_JOB_HISTORY   finished jobs kept for /jobs/{id} (default 1000)
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+JOB_WORKERS = int(os.environ.get("SONICLENS_JOB_WORKERS", "2"))
+JOB_QUEUE_DEPTH = int(os.environ.get("SONICLENS_JOB_QUEUE", "16"))
+JOB_HISTORY = int(os.environ.get("SONICLENS_JOB_HISTORY", "1000"))
+
+class QueueFull(Exception):
+    pass
+
+class Job:
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"   # queued -> running -> done | error
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.transcript = None   # Transcript of the result's segments, built on the first range query
+
+    def info(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error,
+        }
+
+class JobManager:
+    def __init__(self, max_workers: int = JOB_WORKERS, max_queue: int = JOB_QUEUE_DEPTH, history: int = JOB_HISTORY):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="soniclens-job")
+        self._jobs = OrderedDict()
+        self._active = 0
+        self._lock = threading.Lock()
+
+    @property
+    def depth(self) -> int:
+        """Jobs queued or running (reserved slots included)."""
+        return self._active
+
+    def reserve(self):
+        """Claim a slot for a later submit(..., reserved=True); give it back with release()."""
+        with self._lock:
+            if self._active >= self.max_workers + self.max_queue:
+                raise QueueFull(f"{self._active} jobs pending")
+            self._active += 1
+
+    def release(self):
+        with self._lock:
+            self._active -= 1
+
+    def submit(self, kind: str, fn: Callable, *args, cleanup: Optional[Callable] = None,
+               reserved: bool = False, **kwargs) -> Job:
+        """
+        Queue fn(*args, **kwargs); `cleanup()` runs after the job whatever the outcome.
+        reserved=True uses the slot taken by reserve() instead of claiming one.
+        """
+        if not reserved:
+            self.reserve()
+        job = Job(kind)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+        self._executor.submit(self._run, job, fn, args, kwargs, cleanup)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def _run(self, job, fn, args, kwargs, cleanup):
+        job.status = "running"
+        job.started = time.time()
+        try:
+            job.result = fn(*args, **kwargs)
+            job.status = "done"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "error"
+        finally:
+            job.finished = time.time()
+            with self._lock:
+                self._active -= 1
+            if cleanup:
+                try:
+                    cleanup()
+                except Exception:
+                    pass
+
+    def _trim(self):
+        # drop the oldest finished jobs once history is full (caller holds the lock)
+        excess = len(self._jobs) - self.history
+        if excess <= 0:
+            return
+        for job_id in [j.id for j in self._jobs.values() if j.finished is not None][:excess]:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,19 +1,23 @@
 # backend/live_pipeline.py
-# Dependencies: sounddevice, soundfile, webrtcvad, whisper (or openai-whisper)
+# Dependencies: sounddevice, webrtcvad, numpy, whisper (or openai-whisper)
 # Usage: python backend/live_pipeline.py --device <device_index> --model tiny
+#
+# Capture runs in the sounddevice input-stream callback and only copies samples into
+# a ring buffer, so it never stalls. A consumer thread takes overlapping windows out
+# of that buffer as NumPy views and runs VAD + ASR on them; nothing touches disk.
+# Final captions are fed through the shared cleanup engine (backend/cleanup.py) as
+# they arrive, so the merged transcript grows incrementally instead of being rebuilt.
 
 import argparse
-import tempfile
+import threading
 import time
-import os
 import queue
-import subprocess
 import json
-import sounddevice as sd
-import soundfile as sf
+import numpy as np
 import webrtcvad
-from backend.asr.asr_whisper import transcribe_file      # uses your existing wrapper
-from backend.diarization.diarize import simple_vad_segments  # optional
+
+from backend.cleanup import CleanupEngine
+from backend.metrics import span, inc
 
 # CONFIG
 CHUNK_SEC = 6            # length of each chunk (s)
@@ -21,94 +25,171 @@ OVERLAP_SEC = 1          # overlap between chunks (s)
 SAMPLE_RATE = 16000
 CHANNELS = 1
 VAD_MODE = 2             # 0..3 (aggressiveness)
+RING_SEC = 60            # audio kept in the ring; the consumer may lag by at most this much
+PARTIAL_SEC = None       # if set, emit a partial caption every N s of new audio inside a chunk
 
-out_folder = "data/live_chunks"
-os.makedirs(out_folder, exist_ok=True)
+class RingBuffer:
+    """
+    Single-producer / single-consumer int16 ring. Every sample is written twice
+    (at i and i + capacity), so any window up to `capacity` samples is one
+    contiguous slice and can be handed out as a view without copying.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._buf = np.zeros(2 * capacity, dtype=np.int16)
+        self.total = 0                  # samples written since start (monotonic)
+        self.ready = threading.Event()  # set by the producer after each write
 
-def record_chunk(device=None, seconds=CHUNK_SEC, sr=SAMPLE_RATE):
-    data = sd.rec(int(seconds * sr), samplerate=sr, channels=CHANNELS, dtype='int16', device=device)
-    sd.wait()
-    return data
+    def write(self, x: np.ndarray):
+        x = x[-self.capacity:]
+        n = len(x)
+        pos = self.total % self.capacity
+        first = min(n, self.capacity - pos)
+        for off in (0, self.capacity):
+            self._buf[off + pos:off + pos + first] = x[:first]
+            if first < n:
+                self._buf[off:off + n - first] = x[first:]
+        self.total += n
+        self.ready.set()
 
-def write_wav(path, data, sr=SAMPLE_RATE):
-    sf.write(path, data, sr, subtype='PCM_16')
+    def view(self, start: int, n: int) -> np.ndarray:
+        """Samples [start, start + n) as a view; caller must check it hasn't been overwritten."""
+        if n > self.capacity:
+            raise ValueError("window larger than ring capacity")
+        pos = start % self.capacity
+        return self._buf[pos:pos + n]
 
-def vad_has_voice(wav_path):
-    # simple: load bytes -> run webrtcvad on frames
-    import wave
-    wf = wave.open(wav_path, 'rb')
+def vad_has_voice(pcm: np.ndarray, sample_rate: int = SAMPLE_RATE) -> bool:
+    """pcm: int16 mono samples. True as soon as one 30 ms frame is voiced."""
     vad = webrtcvad.Vad(VAD_MODE)
-    sample_rate = wf.getframerate()
-    frames = wf.readframes(wf.getnframes())
-    # split into 30ms frames required by webrtcvad
-    frame_duration_ms = 30
-    n = int(sample_rate * frame_duration_ms / 1000) * 2  # 16-bit -> 2 bytes per sample
-    voiced = False
-    for i in range(0, len(frames), n):
-        chunk = frames[i:i+n]
-        if len(chunk) < n:
-            break
-        if vad.is_speech(chunk, sample_rate):
-            voiced = True
-            break
-    wf.close()
-    return voiced
+    n = int(sample_rate * 30 / 1000)
+    frames = pcm[:len(pcm) // n * n].reshape(-1, n)
+    for frame in frames:
+        if vad.is_speech(frame.tobytes(), sample_rate):
+            return True
+    return False
+
+class LiveTranscriber:
+    """
+    Callback capture + consumer thread. Each transcribed chunk is put on `results`
+    and passed to `on_caption(seg)` if given. With `partial_sec`, the audio gathered
+    so far for the current chunk is also transcribed every `partial_sec` seconds and
+    sent to `on_caption` as {"type": "partial", ...}; full chunks are "final".
+    Final chunks are also merged/normalized incrementally into `transcript`.
+    """
+    def __init__(self, device=None, model="small", language="en", on_caption=None,
+                 chunk_sec=CHUNK_SEC, overlap_sec=OVERLAP_SEC, sr=SAMPLE_RATE, partial_sec=PARTIAL_SEC):
+        self.device = device
+        self.model = model
+        self.language = language
+        self.on_caption = on_caption
+        self.sr = sr
+        self.chunk = int(chunk_sec * sr)
+        self.hop = int((chunk_sec - overlap_sec) * sr)
+        self.partial = int(partial_sec * sr) if partial_sec else None
+        self.ring = RingBuffer(int(max(RING_SEC, 2 * chunk_sec) * sr))
+        self.results = queue.Queue()
+        self.cleanup = CleanupEngine()
+        self.transcript = []  # merged, normalized segments (appended as they become final)
+        self.dropped = 0
+        self._stop = threading.Event()
+        self._stream = None
+        self._worker = None
+        self._t0 = None
+
+    def _callback(self, indata, frames, time_info, status):
+        # audio thread: copy and return, nothing else
+        self.ring.write(indata[:, 0])
+
+    def _transcribe(self, start, n, kind):
+        from backend.asr.asr_whisper import transcribe_array
+        window = self.ring.view(start, n)
+        with span("live_vad"):
+            voiced = vad_has_voice(window, self.sr)
+        if not voiced:
+            return None
+        audio = window.astype(np.float32) / 32768.0  # copy, so later writes can't race ASR
+        try:
+            with span("live_asr", kind=kind):
+                text = transcribe_array(audio, language=self.language, model_name=self.model)
+        except Exception as e:
+            text = f"[ASR error: {e}]"
+        seg = {
+            "type": kind,
+            "start_ts": self._t0 + start / self.sr,
+            "end_ts": self._t0 + (start + n) / self.sr,
+            "text": text
+        }
+        if self.on_caption:
+            self.on_caption(seg)
+        return seg
+
+    def _consume(self):
+        next_start = 0
+        last_partial = 0
+        while not self._stop.is_set():
+            if self.ring.total < next_start + self.chunk:
+                have = self.ring.total - next_start
+                if self.partial and have - last_partial >= self.partial:
+                    last_partial = have
+                    self._transcribe(next_start, have, "partial")
+                    continue
+                self.ring.ready.wait(timeout=0.2)
+                self.ring.ready.clear()
+                continue
+            if self.ring.total - next_start > self.ring.capacity:
+                # consumer fell a full ring behind: skip to the newest complete window
+                skip_to = self.ring.total - self.chunk
+                self.dropped += skip_to - next_start
+                inc("soniclens_live_dropped_seconds_total", (skip_to - next_start) / self.sr)
+                next_start = skip_to
+            seg = self._transcribe(next_start, self.chunk, "final")
+            if seg is not None:
+                print(f"[{time.strftime('%H:%M:%S')}] TRANSCRIPT:", seg["text"])
+                self.results.put(seg)
+                self.transcript.extend(self.cleanup.feed(
+                    {"start": seg["start_ts"], "end": seg["end_ts"], "speaker": None, "text": seg["text"]}))
+            else:
+                # silent window: the open merged segment may now be final
+                self.transcript.extend(self.cleanup.advance(self._t0 + (next_start + self.chunk) / self.sr))
+            next_start += self.hop
+            last_partial = self.chunk - self.hop  # the overlap is already in the next window
+
+    def start(self):
+        import sounddevice as sd
+        self._stop.clear()
+        self._t0 = time.time()
+        self._stream = sd.InputStream(samplerate=self.sr, channels=CHANNELS, dtype="int16",
+                                      device=self.device, callback=self._callback)
+        self._stream.start()
+        self._worker = threading.Thread(target=self._consume, name="live-asr", daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+        if self._worker is not None:
+            self._worker.join(timeout=30)
+            self._worker = None
+        self.transcript.extend(self.cleanup.close())
 
 def run_live(device=None, model="small", language="en"):
     print("Live pipeline starting — press Ctrl+C to stop")
-    ring = queue.Queue()
+    live = LiveTranscriber(device=device, model=model, language=language)
+    live.start()
     try:
-        # rolling buffer approach: write overlapping chunks and process
         while True:
-            t0 = time.time()
-            # record chunk
-            tmp = tempfile.NamedTemporaryFile(suffix=".wav", delete=False, dir=out_folder)
-            tmp_name = tmp.name
-            tmp.close()
-            data = record_chunk(device=device, seconds=CHUNK_SEC)
-            write_wav(tmp_name, data, SAMPLE_RATE)
-            # run VAD
-            has_voice = vad_has_voice(tmp_name)
-            print(f"[{time.strftime('%H:%M:%S')}] Recorded {tmp_name} — voice:{has_voice}")
-            if has_voice:
-                try:
-                    text = transcribe_file(tmp_name, language=language)
-                except Exception as e:
-                    text = f"[ASR error: {e}]"
-                now = time.time()
-                seg = {
-                    "filename": os.path.basename(tmp_name),
-                    "start_ts": now - CHUNK_SEC,
-                    "end_ts": now,
-                    "text": text
-                }
-                print("TRANSCRIPT:", text)
-                ring.put(seg)
-            else:
-                # optional: keep non-voice for context
-                pass
-
-            # remove old temp files so disk doesn't fill
-            for f in os.listdir(out_folder):
-                path = os.path.join(out_folder, f)
-                if time.time() - os.path.getmtime(path) > 300:
-                    try:
-                        os.remove(path)
-                    except:
-                        pass
-
-            # sleep only to create the desired overlap
-            elapsed = time.time() - t0
-            sleep_time = max(0.01, CHUNK_SEC - elapsed - OVERLAP_SEC)
-            time.sleep(sleep_time)
-
+            time.sleep(0.5)
     except KeyboardInterrupt:
         print("Stopping live capture.")
-        # collect ring contents and print JSON
-        items = []
-        while not ring.empty():
-            items.append(ring.get())
-        print(json.dumps(items, indent=2))
+        live.stop()
+        if live.dropped:
+            print(f"[WARN] consumer lagged; skipped {live.dropped / live.sr:.1f}s of audio")
+        # cleaned transcript (raw chunks stay available on live.results)
+        print(json.dumps(live.transcript, indent=2))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,175 @@
+# backend/metrics.py
+"""
+In-process metrics with Prometheus text exposition (served by /metrics).
+
+- span("vad") times a stage into soniclens_stage_seconds{stage="vad"}
+- observe_audio("asr", audio_sec, proc_sec) records audio duration vs processing
+  time (real-time factor histogram + running sums per stage)
+- inc(name) bumps a counter; gauge(name, fn) is read at scrape time
+
+Set SONICLENS_METRICS=0 to disable: span() then hands back one shared no-op
+object and the other calls return immediately.
+"""
+import bisect
+import os
+import threading
+import time
+from typing import Callable, Dict, Tuple
+
+ENABLED = os.environ.get("SONICLENS_METRICS", "1") != "0"
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+AUDIO_BUCKETS = (1, 5, 10, 30, 60, 300, 600, 1800, 3600, 7200)
+RTF_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5)
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float):
+        self.counts[bisect.bisect_left(self.buckets, v)] += 1
+        self.sum += v
+        self.count += 1
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._hists: Dict[Tuple[str, Tuple], Histogram] = {}
+        self._hist_buckets: Dict[str, tuple] = {}
+        self._gauges: Dict[str, Tuple[Callable[[], object], str]] = {}
+        self._help: Dict[str, str] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, buckets=SECONDS_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self._hists.get(key)
+            if h is None:
+                h = self._hists[key] = Histogram(self._hist_buckets.setdefault(name, buckets))
+            h.observe(value)
+
+    def gauge(self, name: str, fn: Callable[[], object], help: str = "", label: str = "key"):
+        """fn() returns a number, or a {label value: number} dict exported with `label`."""
+        self._gauges[name] = (fn, label)
+        if help:
+            self._help[name] = help
+
+    def describe(self, name: str, help: str):
+        self._help[name] = help
+
+    def render(self) -> str:
+        """Prometheus text format 0.0.4."""
+        lines = []
+        with self._lock:
+            counters = dict(self._counters)
+            hists = {k: (h.buckets, list(h.counts), h.sum, h.count) for k, h in self._hists.items()}
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), v in sorted(counters.items()):
+            header(name, "counter")
+            lines.append(f"{name}{_labels(labels)} {v}")
+        for (name, labels), (buckets, counts, total, count) in sorted(hists.items()):
+            header(name, "histogram")
+            cum = 0
+            for b, c in zip(buckets, counts):
+                cum += c
+                lines.append(f"{name}_bucket{_labels(labels + (('le', _num(b)),))} {cum}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        for name, (fn, label) in sorted(self._gauges.items()):
+            try:
+                value = fn()
+            except Exception:
+                continue
+            header(name, "gauge")
+            if isinstance(value, dict):
+                for label_value, v in sorted(value.items()):
+                    lines.append(f"{name}{_labels(((label, label_value),))} {v}")
+            else:
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+def _num(v):
+    return f"{v:g}"
+
+def _labels(labels) -> str:
+    if not labels:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels)
+    return "{" + body + "}"
+
+registry = Metrics()
+registry.describe("soniclens_stage_seconds", "Wall time per pipeline stage")
+registry.describe("soniclens_stage_errors_total", "Stages that raised")
+registry.describe("soniclens_audio_seconds", "Duration of audio processed per stage")
+registry.describe("soniclens_stage_rtf", "Processing time / audio duration per stage")
+registry.describe("soniclens_audio_seconds_total", "Audio seconds processed per stage")
+registry.describe("soniclens_processing_seconds_total", "Processing seconds spent per stage")
+
+class _Span:
+    __slots__ = ("stage", "labels", "t0")
+
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.t0
+        registry.observe("soniclens_stage_seconds", elapsed, stage=self.stage, **self.labels)
+        if exc_type is not None:
+            registry.inc("soniclens_stage_errors_total", stage=self.stage)
+        return False
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+def span(stage: str, **labels):
+    """with span("asr"): ...  -- times the block into soniclens_stage_seconds."""
+    if not ENABLED:
+        return _NO_SPAN
+    return _Span(stage, labels)
+
+def observe_audio(stage: str, audio_sec: float, proc_sec: float):
+    if not ENABLED or audio_sec <= 0:
+        return
+    registry.observe("soniclens_audio_seconds", audio_sec, buckets=AUDIO_BUCKETS, stage=stage)
+    registry.observe("soniclens_stage_rtf", proc_sec / audio_sec, buckets=RTF_BUCKETS, stage=stage)
+    registry.inc("soniclens_audio_seconds_total", audio_sec, stage=stage)
+    registry.inc("soniclens_processing_seconds_total", proc_sec, stage=stage)
+
+def inc(name: str, value: float = 1.0, **labels):
+    if ENABLED:
+        registry.inc(name, value, **labels)
+
+def render() -> str:
+    return registry.render()
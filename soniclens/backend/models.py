@@ -0,0 +1,147 @@
+# backend/models.py
+"""
+One registry for every heavyweight model (Whisper, Vosk, summarizer).
+
+- get(key, loader) loads lazily; a per-key lock makes concurrent callers wait
+  for a single load instead of loading the same model twice.
+- Resident models are kept in LRU order and evicted once their estimated size
+  exceeds the memory budget (the model being returned is never evicted).
+- preload(specs) loads + warms a configured set, e.g. at FastAPI startup.
+
+Env:
+  SONICLENS_MODEL_BUDGET_MB   memory budget for resident models (default 4096)
+  SONICLENS_PRELOAD           comma list, e.g. "whisper:small,summarizer,vosk:models/vosk-model-small-en-us-0.15"
+"""
+import gc
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Iterable, Optional
+
+from backend.metrics import span
+
+MODEL_BUDGET_BYTES = int(float(os.environ.get("SONICLENS_MODEL_BUDGET_MB", "4096")) * 1024 * 1024)
+PRELOAD = os.environ.get("SONICLENS_PRELOAD", "")
+
+def estimate_size(model: Any) -> int:
+    """Bytes held by a torch module (or a transformers pipeline wrapping one); 0 if unknown."""
+    module = getattr(model, "model", model)
+    params = getattr(module, "parameters", None)
+    if not callable(params):
+        return 0
+    total = sum(p.numel() * p.element_size() for p in module.parameters())
+    buffers = getattr(module, "buffers", None)
+    if callable(buffers):
+        total += sum(b.numel() * b.element_size() for b in module.buffers())
+    return total
+
+def dir_size(path: str) -> int:
+    total = 0
+    for dirpath, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+class ModelRegistry:
+    def __init__(self, budget_bytes: int = MODEL_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._models = OrderedDict()  # key -> (model, size)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get(self, key: str, loader: Callable[[], Any], size: Optional[Callable[[Any], int]] = None) -> Any:
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return self._models[key][0]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                if key in self._models:  # loaded by another thread while we waited
+                    self._models.move_to_end(key)
+                    self.hits += 1
+                    return self._models[key][0]
+            with span("model_load", model=key.split(":")[0]):
+                model = loader()
+            nbytes = (size or estimate_size)(model)
+            with self._lock:
+                self.misses += 1
+                self._models[key] = (model, nbytes)
+                self._evict(keep=key)
+        return model
+
+    def _evict(self, keep: str):
+        # caller holds the lock
+        evicted = False
+        while self.resident_bytes > self.budget_bytes and len(self._models) > 1:
+            oldest = next(iter(self._models))
+            if oldest == keep:
+                self._models.move_to_end(keep)
+                continue
+            del self._models[oldest]
+            self.evictions += 1
+            evicted = True
+        if evicted:
+            gc.collect()
+
+    def evict(self, key: str):
+        with self._lock:
+            if self._models.pop(key, None) is not None:
+                self.evictions += 1
+        gc.collect()
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(nbytes for _, nbytes in self._models.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "resident": {k: nbytes for k, (_, nbytes) in self._models.items()},
+                "resident_bytes": self.resident_bytes,
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+registry = ModelRegistry()
+
+def preload(specs: Iterable[str]):
+    """
+    Load and warm models named like "whisper:<name>[@device]", "summarizer",
+    "vosk:<model dir>". Unknown or failing specs are reported, not fatal.
+    """
+    loaded = []
+    for spec in specs:
+        spec = spec.strip()
+        if not spec:
+            continue
+        kind, _, arg = spec.partition(":")
+        try:
+            if kind == "whisper":
+                from backend.asr.asr_whisper import warmup
+                name, _, device = (arg or "small").partition("@")
+                warmup(name, device=device or None)
+            elif kind == "summarizer":
+                from backend.summarizer.extract_actions import warmup
+                warmup()
+            elif kind == "vosk":
+                from backend.asr.asr_vosk import load_vosk_model
+                load_vosk_model(arg)
+            else:
+                raise ValueError(f"unknown model kind '{kind}'")
+            loaded.append(spec)
+        except Exception as e:
+            print(f"[WARN] preload {spec} failed: {e}")
+    return loaded
+
+def preload_from_env():
+    return preload(PRELOAD.split(","))
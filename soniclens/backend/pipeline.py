@@ -1,14 +1,21 @@
 # backend/pipeline.py
 """
-Chain: diarization -> cut segments (ffmpeg) -> transcribe each -> return list of speaker-tagged entries.
+Chain: diarization -> memory-map the audio once + read segment windows -> transcribe each -> return list of speaker-tagged entries.
+The stages run concurrently over bounded queues (VAD -> extract -> ASR), so the first
+segments are transcribed while VAD is still reading the file.
 Usage:
-    python backend/pipeline.py data/samples/meeting1.wav
+    python backend/pipeline.py data/samples/meeting1.wav [--workers 4 --threads 8]
+    python backend/pipeline.py long.wav --out long.jsonl [--resume]   # stream segments to JSONL as they finish
 """
 import os
 import sys
 import json
+import queue
 import subprocess
 import tempfile
+import threading
+import time
+from collections import deque
 
 # -- Try to import helpers from your repo; fall back to script calls if import fails
 try:
@@ -17,9 +24,20 @@ except Exception:
     simple_vad_segments = None
 
 try:
-    from backend.asr.asr_whisper import transcribe_file
+    from backend.asr.asr_whisper import transcribe_batch, transcribe_words
 except Exception:
-    transcribe_file = None
+    transcribe_batch = transcribe_words = None
+
+from backend.audio import audio_duration, open_audio, write_wav
+from backend.metrics import span, observe_audio
+
+# margins kept around each segment so words at edges are preserved
+PRE_ROLL = 0.15
+POST_ROLL = 0.15
+
+# pack short segments into ~28 s windows transcribed once with word timestamps
+# (backend.asr.packing); 0 transcribes every segment as its own clip
+PACK_SEGMENTS = os.environ.get("SONICLENS_PACK_SEGMENTS", "1") == "1"
 
 def call_diarize_script(path):
     """Fallback: call diarize.py and parse its stdout (assumes it prints a Python list or JSON)."""
@@ -46,65 +64,407 @@ def call_asr_script(path):
         raise RuntimeError(f"ASR script stderr: {res.stderr}")
     return ""
 
-def cut_audio_segment(src, start, end, out_path):
-    """Cut with a small margin so words at edges are preserved."""
-    s = max(0, start - 0.15)
-    e = end + 0.15
-    cmd = [
-        "ffmpeg", "-y", "-i", src,
-        "-ss", str(s), "-to", str(e),
-        "-ar", "16000", "-ac", "1", "-f", "wav", out_path
-    ]
-    subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
-
-def diarize_and_transcribe(audio_path, language="en"):
-    # 1) get segments
-    if callable(simple_vad_segments):
-        segments = simple_vad_segments(audio_path)
+def transcribe_clip_via_script(clip):
+    """Fallback for when the whisper wrapper can't be imported: the script needs a file."""
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
+        seg_path = tmp.name
+    try:
+        write_wav(seg_path, clip)
+        return call_asr_script(seg_path)
+    finally:
+        try: os.remove(seg_path)
+        except: pass
+
+def _batches(n, size):
+    for b in range(0, n, size):
+        yield list(range(b, min(b + size, n)))
+
+def run_params(language="en", pack=PACK_SEGMENTS):
+    """What makes two pipeline runs comparable (result cache key, resume checkpoint)."""
+    from backend.asr.whisper_options import model_tag, DECODE_OPTIONS
+    from backend.asr.packing import PACK_WINDOW_SEC
+    from backend.diarization.embeddings import encoder_available
+    return {"model": model_tag(), "language": language, "decode": DECODE_OPTIONS,
+            "pre_roll": PRE_ROLL, "post_roll": POST_ROLL,
+            "pack_window": PACK_WINDOW_SEC if pack and callable(transcribe_words) else None,
+            # alternating fallback labels never match (or resume into) a run with embeddings
+            "speaker_embeddings": encoder_available()}
+
+def iter_diarize_and_transcribe(audio_path, language="en", batch_size=8, workers=0, threads_per_worker=None,
+                                skip=None, on_total=None, pack=PACK_SEGMENTS):
+    """
+    Generator form of diarize_and_transcribe: yields lists of finished entries (one
+    list per ASR batch) in start order, so callers can persist them as they complete.
+    skip(entry) -> True leaves a segment out (e.g. already done in a resumed run);
+    on_total(n) is called once with the total number of segments (skipped ones included).
+    pack=True transcribes packed windows (one list per window) instead of single clips;
+    it needs the whisper wrapper and is ignored without it.
+
+    With the in-process diarizer this is the staged pipeline (VAD -> extract -> ASR
+    running concurrently); otherwise the script fallback runs phase by phase.
+    """
+    pack = pack and callable(transcribe_words)
+    run = _iter_staged if callable(simple_vad_segments) else _iter_phased
+    yield from run(audio_path, language, batch_size, workers, threads_per_worker, skip, on_total, pack)
+
+# --- staged pipeline -------------------------------------------------------------
+#
+#   VAD thread --(SEGMENT_QUEUE)--> extract thread --(CLIP_QUEUE)--> ASR (caller's thread)
+#
+# VAD yields segments while it reads the file; the extract thread labels speakers
+# online (one embedding batch over whatever segments are queued, up to SPEAKER_BATCH)
+# and cuts each clip out of the memory-mapped source (or packs it into a window);
+# ASR takes whatever is queued (up to batch_size) as soon as it is free. Bounded queues give backpressure:
+# a stage that runs ahead blocks instead of piling clips up in memory.
+
+SEGMENT_QUEUE = 64   # VAD segments waiting to be cut
+CLIP_QUEUE = 32      # cut clips waiting for ASR
+SPEAKER_BATCH = 16   # segments embedded per encoder call in the extract stage
+
+class _Done:
+    def __init__(self, total):
+        self.total = total
+
+class _Failed:
+    def __init__(self, exc):
+        self.exc = exc
+
+def _put(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _Done(None)
+
+def _start_stage(name, fn, out_q, stop, *args):
+    def run():
+        try:
+            fn(out_q, stop, *args)
+        except BaseException as e:
+            _put(out_q, _Failed(e), stop)
+    t = threading.Thread(target=run, name=f"pipeline-{name}", daemon=True)
+    t.start()
+    return t
+
+def _vad_stage(out_q, stop, audio_path):
+    from backend.diarization.diarize import iter_vad_segments
+    with span("vad"):
+        for seg in iter_vad_segments(audio_path):
+            if not _put(out_q, seg, stop):
+                return
+    _put(out_q, _Done(None), stop)
+
+class _OnlineSpeakers:
+    """
+    Speaker labels for segments as they arrive: embeddings in batches, then the
+    streaming leader rule (embeddings.OnlineClusterer), so a label is final as soon
+    as it is given. Alternating S1/S2 when the embedding stack isn't usable, as in
+    diarize.label_speakers.
+    """
+    def __init__(self, source):
+        # the source's content key (uploads, decoded PCM) keys the embedding cache;
+        # plain files aren't hashed here, SegmentWriter already does that for resume
+        self.key = getattr(source, "key", None)
+        try:
+            from backend.diarization.embeddings import get_encoder, OnlineClusterer
+            get_encoder()
+            self.clusterer = OnlineClusterer()
+        except Exception as e:
+            if not isinstance(e, ImportError):
+                print(f"[WARN] speaker embeddings unavailable, alternating labels: {e}")
+            self.clusterer = None
+
+    def label(self, source, segments, first):
+        """Labels for `segments`, the segments numbered first, first + 1, ... in the recording."""
+        if self.clusterer is not None:
+            from backend.diarization.embeddings import embed_segments
+            try:
+                with span("speaker_embedding"):
+                    embs = embed_segments(source, segments, key=self.key)
+                return [f"S{self.clusterer.add(emb)+1}" for emb in embs]
+            except Exception as e:
+                print(f"[WARN] speaker embedding failed, alternating labels from here: {e}")
+                self.clusterer = None
+        return [f"S{i%2+1}" for i in range(first, first + len(segments))]
+
+def _extract_stage(out_q, stop, in_q, source, speakers, skip, pack):
+    """Labels segments; queues (entry, clip) pairs, or PackedWindows when packing."""
+    packer = None
+    if pack:
+        from backend.asr.packing import Packer
+        packer = Packer(source, pad=PRE_ROLL)
+    n = 0
+    for segments in _queued_batches(in_q, stop, SPEAKER_BATCH, None):
+        for seg, speaker in zip(segments, speakers.label(source, segments, n)):
+            entry = {"speaker": speaker, "start": float(seg["start"]), "end": float(seg["end"])}
+            n += 1
+            if skip is not None and skip(entry):
+                continue
+            with span("extract"):
+                if packer is not None:
+                    item = packer.add(entry)
+                else:
+                    item = (entry, source.window(entry["start"], entry["end"], PRE_ROLL, POST_ROLL))
+            if item is not None and not _put(out_q, item, stop):
+                return
+    if stop.is_set():
+        return
+    window = packer.flush() if packer is not None else None
+    if window is not None and not _put(out_q, window, stop):
+        return
+    _put(out_q, _Done(n), stop)
+
+def _queued_batches(clips_q, stop, batch_size, on_total):
+    """Batches of queued items (segments, (entry, clip) pairs): wait for the first, then take what is already queued."""
+    while True:
+        item = _get(clips_q, stop)
+        batch = []
+        while True:
+            if isinstance(item, _Failed):
+                raise item.exc
+            if isinstance(item, _Done):
+                if batch:
+                    yield batch
+                if on_total is not None and item.total is not None:
+                    on_total(item.total)
+                return
+            batch.append(item)
+            if len(batch) >= batch_size:
+                break
+            try:
+                item = clips_q.get_nowait()
+            except queue.Empty:
+                break
+        yield batch
+
+def _finish(batch, texts):
+    for (entry, _), text in zip(batch, texts):
+        entry["text"] = text
+    return [entry for entry, _ in batch]
+
+def _asr_in_process(batch, language, batch_size):
+    clips = [clip for _, clip in batch]
+    try:
+        if callable(transcribe_batch):
+            return transcribe_batch(clips, language=language, batch_size=batch_size)
+        texts = []
+        for clip in clips:
+            try:
+                texts.append(transcribe_clip_via_script(clip))
+            except Exception as e:
+                texts.append(f"[ASR error: {e}]")
+        return texts
+    except Exception as e:
+        return [f"[ASR error: {e}]"] * len(clips)
+
+def _pool_result(batch, future):
+    try:
+        return _finish(batch, [text for _, text in future.result()])
+    except Exception as e:
+        return _finish(batch, [f"[ASR error: {e}]"] * len(batch))
+
+def _window_result(window, future):
+    try:
+        return window.finish(future.result())
+    except Exception as e:
+        return window.failed(e)
+
+def _transcribe_windows(windows, language, workers, threads_per_worker):
+    """Packed windows -> finished entries, one list per window, in order."""
+    if workers and workers > 0:
+        from backend.asr.worker_pool import WorkerPool
+        with WorkerPool(workers, threads_per_worker, language=language) as pool:
+            pending = deque()
+            for window in windows:
+                pending.append((window, pool.submit_words(window.audio)))
+                while pending and (pending[0][1].done() or len(pending) >= pool.max_in_flight):
+                    yield _window_result(*pending.popleft())
+            while pending:
+                yield _window_result(*pending.popleft())
     else:
-        segments = call_diarize_script(audio_path)
+        for window in windows:
+            try:
+                yield window.finish(transcribe_words(window.audio, language=language))
+            except Exception as e:
+                yield window.failed(e)
+
+def _iter_staged(audio_path, language, batch_size, workers, threads_per_worker, skip, on_total, pack):
+    stop = threading.Event()
+    segments_q = queue.Queue(SEGMENT_QUEUE)
+    clips_q = queue.Queue(CLIP_QUEUE)
+    with open_audio(audio_path) as source:
+        speakers = _OnlineSpeakers(source)
+        stages = [_start_stage("vad", _vad_stage, segments_q, stop, audio_path),
+                  _start_stage("extract", _extract_stage, clips_q, stop, segments_q, source, speakers, skip, pack)]
+        try:
+            if pack:
+                windows = (b[0] for b in _queued_batches(clips_q, stop, 1, on_total))
+                yield from _transcribe_windows(windows, language, workers, threads_per_worker)
+                return
+            batches = _queued_batches(clips_q, stop, batch_size, on_total)
+            if workers and workers > 0 and callable(transcribe_batch):
+                from backend.asr.worker_pool import WorkerPool
+                with WorkerPool(workers, threads_per_worker, language=language, batch_size=batch_size) as pool:
+                    pending = deque()
+                    for batch in batches:
+                        pending.append((batch, pool.submit(range(len(batch)), [clip for _, clip in batch])))
+                        # ordered: hand back the oldest batch once it's done or the pool is saturated
+                        while pending and (pending[0][1].done() or len(pending) >= pool.max_in_flight):
+                            yield _pool_result(*pending.popleft())
+                    while pending:
+                        yield _pool_result(*pending.popleft())
+            else:
+                for batch in batches:
+                    yield _finish(batch, _asr_in_process(batch, language, batch_size))
+        finally:
+            stop.set()
+            for t in stages:
+                t.join()
+
+# --- phased fallback (diarize script) ----------------------------------------------
+
+def _iter_phased(audio_path, language, batch_size, workers, threads_per_worker, skip, on_total, pack):
+    segments = call_diarize_script(audio_path)
 
     # ensure segments is a list of dicts with start/end
     if not isinstance(segments, list):
         raise RuntimeError("diarize returned non-list")
 
-    results = []
+    entries = []
     for i, seg in enumerate(segments):
         # seg expected to have 'start' and 'end'; tolerate different keys
         start = seg.get("start") if isinstance(seg, dict) else seg[0]
         end = seg.get("end") if isinstance(seg, dict) else seg[1]
         speaker = seg.get("speaker", f"S{i%2+1}") if isinstance(seg, dict) else f"S{i%2+1}"
-        # create temp file
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
-            seg_path = tmp.name
-        try:
-            cut_audio_segment(audio_path, float(start), float(end), seg_path)
-        except Exception as e:
-            # if cut fails, skip but record error
-            results.append({"speaker": speaker, "start": start, "end": end, "text": f"[cut error: {e}]"})
-            try: os.remove(seg_path)
-            except: pass
-            continue
+        entries.append({"speaker": speaker, "start": float(start), "end": float(end)})
+    entries.sort(key=lambda e: e["start"])
+    if on_total is not None:
+        on_total(len(entries))
+    if skip is not None:
+        entries = [e for e in entries if not skip(e)]
+    if not entries:
+        return
+
+    # memory-map the source once; clips are read from the map one batch at a time,
+    # so memory follows the batch, not the recording length
+    with open_audio(audio_path) as source:
+        if pack:
+            from backend.asr.packing import iter_windows
+            yield from _transcribe_windows(iter_windows(source, entries, pad=PRE_ROLL), language,
+                                           workers, threads_per_worker)
+            return
+        yield from _transcribe_entries(source.clips(entries, PRE_ROLL, POST_ROLL), entries, language,
+                                       batch_size, workers, threads_per_worker)
+
+def _transcribe_entries(clips, entries, language, batch_size, workers, threads_per_worker):
+    # 3) transcribe clips batch by batch using the imported wrapper if available otherwise fallback
+    def finished(idx, texts):
+        for i, text in zip(idx, texts):
+            entries[i]["text"] = text
+        return [entries[i] for i in idx]
 
-        # transcribe using imported wrapper if available otherwise fallback
+    if workers and workers > 0 and callable(transcribe_batch):
+        from backend.asr.worker_pool import iter_transcribe_parallel
+        done = 0
         try:
-            if callable(transcribe_file):
-                text = transcribe_file(seg_path, language=language)
-            else:
-                text = call_asr_script(seg_path)
+            for chunk in iter_transcribe_parallel(clips, workers, threads_per_worker,
+                                                  language=language, batch_size=batch_size):
+                done += len(chunk)
+                yield finished([i for i, _ in chunk], [t for _, t in chunk])
         except Exception as e:
-            text = f"[ASR error: {e}]"
+            rest = list(range(done, len(clips)))
+            yield finished(rest, [f"[ASR error: {e}]"] * len(rest))
+    elif callable(transcribe_batch):
+        for idx in _batches(len(clips), batch_size):
+            try:
+                texts = transcribe_batch([clips[i] for i in idx], language=language, batch_size=batch_size)
+            except Exception as e:
+                texts = [f"[ASR error: {e}]"] * len(idx)
+            yield finished(idx, texts)
+    else:
+        for idx in _batches(len(clips), batch_size):
+            texts = []
+            for i in idx:
+                try:
+                    texts.append(transcribe_clip_via_script(clips[i]))
+                except Exception as e:
+                    texts.append(f"[ASR error: {e}]")
+            yield finished(idx, texts)
 
-        results.append({"speaker": speaker, "start": float(start), "end": float(end), "text": text})
-        try: os.remove(seg_path)
-        except: pass
+def diarized_transcript(audio_path, language="en", batch_size=8, workers=0, threads_per_worker=None,
+                        pack=PACK_SEGMENTS):
+    """
+    The pipeline result as an array-backed Transcript (backend.transcript): finished
+    batches are appended straight into its columns, no per-segment dicts are kept.
+    workers > 0 fans the segments out to a process pool (backend.asr.worker_pool) where
+    every worker preloads the model; threads_per_worker caps torch intra-op threads
+    (default: cores // workers).
+    """
+    from backend.transcript import TranscriptBuilder
+    t0 = time.perf_counter()
+    builder = TranscriptBuilder()
+    for batch in iter_diarize_and_transcribe(audio_path, language=language, batch_size=batch_size,
+                                             workers=workers, threads_per_worker=threads_per_worker, pack=pack):
+        builder.extend(batch)
+    observe_audio("pipeline", audio_duration(audio_path), time.perf_counter() - t0)
+    return builder.build()
+
+def diarize_and_transcribe(audio_path, language="en", batch_size=8, workers=0, threads_per_worker=None,
+                           pack=PACK_SEGMENTS):
+    """diarized_transcript() as a list of {"speaker", "start", "end", "text"} dicts."""
+    return diarized_transcript(audio_path, language=language, batch_size=batch_size, workers=workers,
+                               threads_per_worker=threads_per_worker, pack=pack).to_segments()
 
-    return results
+def diarize_and_transcribe_to_file(audio_path, out_path, resume=False, language="en", batch_size=8,
+                                   workers=0, threads_per_worker=None, pack=PACK_SEGMENTS):
+    """
+    Streaming variant: appends each finished batch to `out_path` (JSONL) with a
+    checkpoint next to it, keeping nothing in memory. resume=True skips segments
+    a previous (crashed) run already wrote. Batches are also added to the search
+    index (backend.search) under the output's file name. Returns the number of
+    segments written.
+    """
+    from backend.search import meeting_name
+    from backend.transcript_io import SegmentWriter
+    t0 = time.perf_counter()
+    params = run_params(language, pack)
+    written = 0
+    with SegmentWriter(out_path, audio_path, params, resume=resume, meeting=meeting_name(out_path)) as writer:
+        for batch in iter_diarize_and_transcribe(audio_path, language=language, batch_size=batch_size,
+                                                 workers=workers, threads_per_worker=threads_per_worker,
+                                                 skip=writer.is_done, on_total=writer.set_total, pack=pack):
+            writer.write(batch)
+            written += len(batch)
+    observe_audio("pipeline", audio_duration(audio_path), time.perf_counter() - t0)
+    return written
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python backend/pipeline.py <audio.wav>")
+        print("Usage: python backend/pipeline.py <audio.wav> [--workers N] [--threads N] [--cache] [--no-pack] [--out out.jsonl [--resume]]")
         sys.exit(1)
     audio = sys.argv[1]
-    out = diarize_and_transcribe(audio)
+    workers = int(sys.argv[sys.argv.index("--workers")+1]) if "--workers" in sys.argv else 0
+    threads = int(sys.argv[sys.argv.index("--threads")+1]) if "--threads" in sys.argv else None
+    pack = PACK_SEGMENTS and "--no-pack" not in sys.argv
+    if "--out" in sys.argv:
+        out_path = sys.argv[sys.argv.index("--out")+1]
+        n = diarize_and_transcribe_to_file(audio, out_path, resume="--resume" in sys.argv,
+                                           workers=workers, threads_per_worker=threads, pack=pack)
+        print(f"Wrote {n} segments to {out_path}")
+        sys.exit(0)
+    if "--cache" in sys.argv:
+        from backend.cache import cached_diarize_and_transcribe
+        out = cached_diarize_and_transcribe(audio, workers=workers, threads_per_worker=threads, pack=pack)
+    else:
+        out = diarize_and_transcribe(audio, workers=workers, threads_per_worker=threads, pack=pack)
     print(json.dumps(out, indent=2, ensure_ascii=False))
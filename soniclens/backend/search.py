@@ -0,0 +1,208 @@
+# backend/search.py
+"""
+Full-text search over stored transcripts ("who said X, and when").
+
+An on-disk SQLite database (WAL mode) holds one row per segment,
+(meeting, speaker, start, end, text), plus an FTS5 inverted index over the text,
+kept in sync by triggers. Queries are ranked with BM25 and return timestamped hits
+with a highlighted snippet; the lookup only reads the postings of the query terms,
+so it stays in the millisecond range however many meetings are indexed.
+
+A meeting is one transcript file, identified by its absolute path
+(meeting_name), so outputs that share a file name in different directories, or
+one recording's raw and cleaned transcripts, never replace each other.
+
+The index is maintained incrementally: SegmentWriter (backend.transcript_io)
+adds every batch the pipeline writes, the cleanup CLI indexes the file it writes,
+and `index` below loads existing outputs. A segment written again (a retried
+batch in a resumed run) replaces its previous row; rerunning into the same
+output path replaces the meeting.
+
+Env:
+  SONICLENS_SEARCH_DB   database path (default data/index/search.db)
+  SONICLENS_SEARCH=0    don't index pipeline output
+
+CLI:
+  python backend/search.py index diarized_clean.json more/*.jsonl [--meeting NAME]
+  python backend/search.py query "budget approval" [--speaker S1] [--meeting PATH|NAME] [--limit 20]
+"""
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional
+
+SEARCH_DB = os.environ.get("SONICLENS_SEARCH_DB", os.path.join("data", "index", "search.db"))
+SEARCH_ENABLED = os.environ.get("SONICLENS_SEARCH", "1") != "0"
+
+SNIPPET_TOKENS = 12  # words of context around the match in each hit
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meetings (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    meeting_id INTEGER NOT NULL REFERENCES meetings(id),
+    speaker TEXT,
+    start REAL NOT NULL,
+    "end" REAL NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS segments_span ON segments(meeting_id, start, "end");
+CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(
+    text, content='segments', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS segments_ai AFTER INSERT ON segments BEGIN
+    INSERT INTO segments_fts(rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS segments_ad AFTER DELETE ON segments BEGIN
+    INSERT INTO segments_fts(segments_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+def meeting_name(path: str) -> str:
+    """Meeting a transcript file is indexed as: its absolute path."""
+    return os.path.abspath(path)
+
+def _fts_query(query: str) -> str:
+    """Free text -> FTS5 query: every word must match (quoted, so punctuation can't break the syntax)."""
+    return " ".join('"%s"' % t for t in _TERM.findall(query))
+
+def _indexable(seg: Dict) -> bool:
+    text = (seg.get("text") or "").strip()
+    return bool(text) and not text.startswith("[ASR error")
+
+class SearchIndex:
+    """One database file; a connection per thread, writes serialized by a lock."""
+    def __init__(self, path: str = SEARCH_DB):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._ready = False
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")    # readers don't block the pipeline's writes
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._ready:
+                with self._write_lock:
+                    conn.executescript(_SCHEMA)
+                self._ready = True
+            self._local.conn = conn
+        return conn
+
+    def _meeting_id(self, conn, meeting: str) -> int:
+        conn.execute("INSERT OR IGNORE INTO meetings(name) VALUES (?)", (meeting,))
+        return conn.execute("SELECT id FROM meetings WHERE name = ?", (meeting,)).fetchone()[0]
+
+    @staticmethod
+    def _rows(segments):
+        return [(seg.get("speaker"), float(seg["start"]), float(seg["end"]), seg["text"].strip())
+                for seg in segments if _indexable(seg)]
+
+    @staticmethod
+    def _insert(conn, mid, rows):
+        # explicit delete: REPLACE wouldn't fire the trigger that drops the old postings
+        conn.executemany('DELETE FROM segments WHERE meeting_id = ? AND start = ? AND "end" = ?',
+                         [(mid, start, end) for _, start, end, _ in rows])
+        conn.executemany('INSERT INTO segments(meeting_id, speaker, start, "end", text) VALUES (?, ?, ?, ?, ?)',
+                         [(mid,) + r for r in rows])
+
+    def add_segments(self, meeting: str, segments: Iterable[Dict]) -> int:
+        """Index `segments` under `meeting`; a segment with the same start/end replaces the old row."""
+        rows = self._rows(segments)
+        if not rows:
+            return 0
+        conn = self._conn()
+        with self._write_lock, conn:
+            self._insert(conn, self._meeting_id(conn, meeting), rows)
+        return len(rows)
+
+    def index_meeting(self, meeting: str, segments: Iterable[Dict]) -> int:
+        """Replace everything indexed for `meeting` with `segments` (a list or a Transcript), atomically."""
+        rows = self._rows(segments)
+        conn = self._conn()
+        with self._write_lock, conn:
+            mid = self._meeting_id(conn, meeting)
+            conn.execute("DELETE FROM segments WHERE meeting_id = ?", (mid,))
+            self._insert(conn, mid, rows)
+        return len(rows)
+
+    def remove_meeting(self, meeting: str):
+        conn = self._conn()
+        with self._write_lock, conn:
+            row = conn.execute("SELECT id FROM meetings WHERE name = ?", (meeting,)).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM segments WHERE meeting_id = ?", (row[0],))
+                conn.execute("DELETE FROM meetings WHERE id = ?", (row[0],))
+
+    def search(self, query: str, limit: int = 20, meeting: Optional[str] = None,
+               speaker: Optional[str] = None) -> List[Dict]:
+        """
+        BM25-ranked hits: [{"meeting", "speaker", "start", "end", "text", "snippet", "score"}, ...],
+        best first (higher score = better match). Every query word has to occur in the segment.
+        """
+        match = _fts_query(query)
+        if not match:
+            return []
+        sql = ('SELECT m.name, s.speaker, s.start, s."end", s.text, '
+               "snippet(segments_fts, 0, '[', ']', '...', ?), bm25(segments_fts) AS rank "
+               "FROM segments_fts JOIN segments s ON s.id = segments_fts.rowid "
+               "JOIN meetings m ON m.id = s.meeting_id WHERE segments_fts MATCH ?")
+        args = [SNIPPET_TOKENS, match]
+        if meeting is not None:
+            sql += " AND m.name = ?"
+            args.append(meeting)
+        if speaker is not None:
+            sql += " AND s.speaker = ?"
+            args.append(speaker)
+        sql += " ORDER BY rank LIMIT ?"
+        args.append(limit)
+        return [{"meeting": name, "speaker": spk, "start": start, "end": end, "text": text,
+                 "snippet": snippet, "score": -rank}
+                for name, spk, start, end, text, snippet, rank in self._conn().execute(sql, args)]
+
+    def stats(self) -> Dict:
+        conn = self._conn()
+        meetings = conn.execute("SELECT COUNT(*) FROM meetings").fetchone()[0]
+        segments = conn.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+        return {"path": self.path, "meetings": meetings, "segments": segments}
+
+index = SearchIndex()
+
+def main():
+    import argparse, json, sys
+    from backend.transcript import Transcript
+    p = argparse.ArgumentParser(description="Full-text index over transcripts")
+    sub = p.add_subparsers(dest="command", required=True)
+    p_index = sub.add_parser("index", help="(re)index transcript files (.json list or .jsonl)")
+    p_index.add_argument("paths", nargs="+")
+    p_index.add_argument("--meeting", help="meeting name (default: the file's absolute path); only with one path")
+    p_query = sub.add_parser("query", help="ranked search")
+    p_query.add_argument("query")
+    p_query.add_argument("--meeting", help="transcript path or --meeting name it was indexed under")
+    p_query.add_argument("--speaker")
+    p_query.add_argument("--limit", type=int, default=20)
+    args = p.parse_args()
+
+    if args.command == "index":
+        if args.meeting and len(args.paths) > 1:
+            p.error("--meeting needs exactly one path")
+        for path in args.paths:
+            name = args.meeting or meeting_name(path)
+            n = index.index_meeting(name, Transcript.read(path))
+            print(f"[search] {name}: {n} segments", file=sys.stderr)
+        print(json.dumps(index.stats()))
+    else:
+        meeting = meeting_name(args.meeting) if args.meeting and os.path.exists(args.meeting) else args.meeting
+        hits = index.search(args.query, limit=args.limit, meeting=meeting, speaker=args.speaker)
+        print(json.dumps(hits, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
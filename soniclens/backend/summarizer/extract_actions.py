@@ -4,33 +4,208 @@ try:
 except Exception:
     pipeline = None
 
-SUM = None
+from backend.models import registry, dir_size
+
+SUMMARIZER_MODEL = "sshleifer/distilbart-cnn-12-6"
+
+# map-reduce over long transcripts: distilbart reads ~1k tokens, anything past that is dropped
+CHUNK_MAX_WORDS = 500       # words per map chunk (~650 BPE tokens, well under the model limit)
+CHUNK_MIN_WORDS = 250       # past this, prefer to close a chunk where the speaker changes
+SUMMARY_BATCH = 8           # chunks per batched summarizer call
+MAP_MAX_LENGTH = 80         # tokens per chunk summary
+REDUCE_MAX_LENGTH = 150     # tokens for the final summary
+MIN_LENGTH = 10
+MAX_REDUCE_ROUNDS = 4       # summaries of summaries; each round shrinks the input ~5x
+
+ACTION_KEYWORDS = ["assign", "action", "decide", "should", "will", "deliver", "due"]
+
+_SENTENCE_END = re.compile(r'(?<=[.!?]) +')
+_WORD = re.compile(r"[a-z0-9']+")
+
+_ONNX_FAILED = False  # set after the first failed ONNX load so later calls go straight to torch
+_ONNX_MISSING_WARNED = False
+
+def _get_onnx_summarizer():
+    global _ONNX_FAILED, _ONNX_MISSING_WARNED
+    from backend.summarizer import model_utils
+    if _ONNX_FAILED or model_utils.SUMMARIZER_BACKEND == "torch":
+        return None
+    quantized = model_utils.QUANTIZE
+    if not model_utils.export_ready(SUMMARIZER_MODEL, quantized):
+        # exporting takes minutes: never inside a request; serve torch until warmup/CLI has built it
+        if model_utils.SUMMARIZER_BACKEND == "onnx" and not _ONNX_MISSING_WARNED:
+            _ONNX_MISSING_WARNED = True
+            print(f"[WARN] no ONNX export at {model_utils.export_dir(SUMMARIZER_MODEL, quantized)}, using PyTorch; "
+                  "build it with `python -m backend.summarizer.model_utils export`")
+        return None
+    try:
+        return registry.get(f"summarizer:onnx{'-int8' if quantized else ''}:{SUMMARIZER_MODEL}",
+                            lambda: model_utils.load_summarizer(SUMMARIZER_MODEL, quantized),
+                            size=lambda _: dir_size(model_utils.export_dir(SUMMARIZER_MODEL, quantized)))
+    except Exception as e:
+        _ONNX_FAILED = True
+        if model_utils.SUMMARIZER_BACKEND == "onnx" or not isinstance(e, ImportError):
+            print(f"[WARN] ONNX summarizer unavailable, using PyTorch: {e}")
+        return None
+
 def get_summarizer():
-    global SUM
-    if SUM is None and pipeline is not None:
-        try:
-            SUM = pipeline("summarization", model="sshleifer/distilbart-cnn-12-6")
-        except Exception:
-            SUM = None
-    return SUM
+    """ONNX Runtime pipeline when available (backend.summarizer.model_utils), else PyTorch."""
+    if pipeline is None:
+        return None
+    summ = _get_onnx_summarizer()
+    if summ is not None:
+        return summ
+    try:
+        return registry.get(f"summarizer:{SUMMARIZER_MODEL}",
+                            lambda: pipeline("summarization", model=SUMMARIZER_MODEL))
+    except Exception:
+        return None
+
+def _build_onnx_export():
+    """Export (and quantize) the summarizer ahead of serving; a missing optimum just means torch."""
+    from backend.summarizer import model_utils
+    if model_utils.SUMMARIZER_BACKEND == "torch":
+        return
+    try:
+        model_utils.ensure_export(SUMMARIZER_MODEL, model_utils.QUANTIZE)
+    except Exception as e:
+        if model_utils.SUMMARIZER_BACKEND == "onnx" or not isinstance(e, ImportError):
+            print(f"[WARN] ONNX export of {SUMMARIZER_MODEL} failed, serving PyTorch: {e}")
+
+def warmup():
+    _build_onnx_export()
+    summ = get_summarizer()
+    if summ is None:
+        raise RuntimeError("summarizer not available")
+    summ("Warmup sentence for the summarizer. It only needs a few words.", max_length=16, min_length=4)
+
+def _split_long(seg, max_words):
+    """A single segment over the budget is cut at sentence ends (or hard word limits)."""
+    pieces, cur = [], []
+    for sentence in _SENTENCE_END.split(seg["text"]):
+        words = sentence.split()
+        while len(words) > max_words:
+            if cur:
+                pieces.append(cur)
+                cur = []
+            pieces.append(words[:max_words])
+            words = words[max_words:]
+        if len(cur) + len(words) > max_words:
+            pieces.append(cur)
+            cur = []
+        cur.extend(words)
+    if cur:
+        pieces.append(cur)
+    return [dict(seg, text=" ".join(p)) for p in pieces if p]
+
+def chunk_segments(segments, max_words=CHUNK_MAX_WORDS, min_words=CHUNK_MIN_WORDS):
+    """
+    Group transcript segments ({"speaker", "start", "end", "text"}) into chunks of at
+    most `max_words`, never splitting a segment unless it alone is over the budget.
+    Once a chunk has `min_words`, a speaker change closes it.
+    """
+    chunks, cur, n = [], [], 0
+    for seg in segments:
+        text = (seg.get("text") or "").strip()
+        if not text:
+            continue
+        seg = dict(seg, text=text)
+        for piece in (_split_long(seg, max_words) if len(text.split()) > max_words else [seg]):
+            w = len(piece["text"].split())
+            speaker_turn = cur and piece.get("speaker") != cur[-1].get("speaker")
+            if cur and (n + w > max_words or (n >= min_words and speaker_turn)):
+                chunks.append(cur)
+                cur, n = [], 0
+            cur.append(piece)
+            n += w
+    if cur:
+        chunks.append(cur)
+    return chunks
+
+def _chunk_text(chunk):
+    return " ".join(f"{s['speaker']}: {s['text']}" if s.get("speaker") else s["text"] for s in chunk)
+
+def _summarize(texts, max_length):
+    """Batched summarizer call; inputs come back unchanged when no model is available."""
+    summ = get_summarizer()
+    if not summ or not texts:
+        return list(texts)
+    try:
+        out = summ(list(texts), max_length=max_length, min_length=MIN_LENGTH,
+                   batch_size=SUMMARY_BATCH, truncation=True)
+        return [o["summary_text"] for o in out]
+    except Exception:
+        return list(texts)
+
+def _actions(summary):
+    sentences = _SENTENCE_END.split(summary)
+    return [s.strip() for s in sentences if any(k in s.lower() for k in ACTION_KEYWORDS)]
+
+def _strip_speaker(sentence, chunk):
+    """Drop a leading "S1: " style tag the chunk text (or the model copying it) put there."""
+    head, sep, rest = sentence.partition(": ")
+    if sep and any(head == s.get("speaker") for s in chunk):
+        return rest.strip()
+    return sentence
+
+def _locate(sentence, chunk):
+    """Source segment of the chunk sharing the most words with `sentence`."""
+    words = set(_WORD.findall(sentence.lower()))
+    return max(chunk, key=lambda s: len(words & set(_WORD.findall(s["text"].lower()))))
+
+def _reduce(summaries):
+    """Summaries of summaries until everything fits one model call, then a final pass."""
+    text = " ".join(summaries)
+    if get_summarizer() is None:
+        return text
+    for _ in range(MAX_REDUCE_ROUNDS):
+        if len(text.split()) <= CHUNK_MAX_WORDS:
+            break
+        chunks = chunk_segments([{"text": s} for s in summaries])
+        summaries = _summarize([_chunk_text(c) for c in chunks], MAP_MAX_LENGTH)
+        text = " ".join(summaries)
+    return _summarize([text], REDUCE_MAX_LENGTH)[0]
+
+def summarize_transcript(segments):
+    """
+    Map-reduce over a diarized transcript. Returns
+      {"summary": str, "chunks": n,
+       "actions": [{"text", "speaker", "start", "end", "chunk"}, ...]}
+    Each chunk is summarized (batched), actions are pulled from every chunk summary and
+    pinned to the source segment they came from, then the chunk summaries are reduced.
+    """
+    chunks = chunk_segments(segments)
+    if not chunks:
+        return {"summary": "", "chunks": 0, "actions": []}
+    summaries = _summarize([_chunk_text(c) for c in chunks], MAP_MAX_LENGTH)
+    actions, seen = [], set()
+    for k, (chunk, summary) in enumerate(zip(chunks, summaries)):
+        for sentence in _actions(summary):
+            sentence = _strip_speaker(sentence, chunk)
+            if sentence.lower() in seen:
+                continue
+            seen.add(sentence.lower())
+            src = _locate(sentence, chunk)
+            actions.append({"text": sentence, "speaker": src.get("speaker"),
+                            "start": src.get("start"), "end": src.get("end"), "chunk": k})
+    summary = summaries[0] if len(summaries) == 1 else _reduce(summaries)
+    return {"summary": summary, "chunks": len(chunks), "actions": actions}
 
 def extract_actions_from_text(text: str):
     if not text or len(text.strip()) < 10:
         return []
-    summ = get_summarizer()
-    if summ:
-        try:
-            summary = summ(text, max_length=80, min_length=10)[0]["summary_text"]
-        except Exception:
-            summary = text
-    else:
-        summary = text
-    action_keywords = ["assign", "action", "decide", "should", "will", "deliver", "due"]
-    sentences = re.split(r'(?<=[.!?]) +', summary)
-    actions = [s.strip() for s in sentences if any(k in s.lower() for k in action_keywords)]
+    # plain text has no segments: sentences stand in for them so long inputs are chunked too
+    result = summarize_transcript([{"text": s} for s in _SENTENCE_END.split(text.strip())])
+    actions = [a["text"] for a in result["actions"]]
     if not actions:
-        actions = [summary]
+        actions = [result["summary"]]
     return actions
 
 if __name__ == "__main__":
-    print(extract_actions_from_text("We will pilot at School X. Raj will prepare dataset. Action: create metrics by Friday."))
+    import json, sys
+    if len(sys.argv) > 1:
+        # python backend/summarizer/extract_actions.py diarized_clean.json|.jsonl
+        from backend.transcript_io import read_segments
+        print(json.dumps(summarize_transcript(read_segments(sys.argv[1])), indent=2, ensure_ascii=False))
+    else:
+        print(extract_actions_from_text("We will pilot at School X. Raj will prepare dataset. Action: create metrics by Friday."))
@@ -1,4 +1,207 @@
-# place-holder for model helper functions (e.g., load & fine-tune)
-def load_summarizer():
-    # load a pipeline or custom model here
-    raise NotImplementedError("Use pipeline in extract_actions for MVP")
+# backend/summarizer/model_utils.py
+"""
+ONNX Runtime inference path for the summarizer.
+
+The seq2seq model is exported to ONNX once (optimum), optionally dynamic-int8
+quantized (onnxruntime.quantization), and run on CPU with ONNX Runtime behind a
+regular transformers summarization pipeline, so callers can't tell the difference.
+
+Exports live under ONNX_DIR/<model id>[-int8]/ and are built ahead of serving, by
+the `export` command below or by the summarizer warmup (SONICLENS_PRELOAD=summarizer);
+a request never runs an export. Until the export exists the PyTorch model is served.
+By default only locally cached weights are used (no download at serving time).
+
+Env:
+  SONICLENS_SUMMARIZER_BACKEND    auto (ONNX when optimum + onnxruntime are installed and the export exists) | onnx | torch
+  SONICLENS_ONNX_DIR              export root (default models/onnx)
+  SONICLENS_SUMMARIZER_QUANTIZE   1 = run the int8-quantized export (default 0)
+
+CLI:
+  python -m backend.summarizer.model_utils export [--model ID] [--quantize] [--allow-download] [--validate]
+  python -m backend.summarizer.model_utils validate [--model ID] [--quantize] [--allow-download]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+from typing import Dict, List, Optional
+
+SUMMARIZER_BACKEND = os.environ.get("SONICLENS_SUMMARIZER_BACKEND", "auto")
+ONNX_DIR = os.environ.get("SONICLENS_ONNX_DIR", os.path.join("models", "onnx"))
+QUANTIZE = os.environ.get("SONICLENS_SUMMARIZER_QUANTIZE", "0") == "1"
+
+# greedy decoding keeps torch vs ONNX outputs comparable token for token
+GENERATE_OPTIONS = dict(num_beams=1, do_sample=False)
+VALIDATION_TEXTS = [
+    "We will pilot the app at School X next month. Raj will prepare the dataset and share it by Friday. "
+    "Maria should review the consent forms before the pilot starts.",
+    "The team decided to move the release to June. Action: update the roadmap and tell the partners. "
+    "Budget approval is due next week and Tom will deliver the cost estimate.",
+]
+
+def export_dir(model_id: str, quantized: bool = False) -> str:
+    name = model_id.replace("/", "__") + ("-int8" if quantized else "")
+    return os.path.join(ONNX_DIR, name)
+
+def export_ready(model_id: str, quantized: bool = False) -> bool:
+    return os.path.exists(os.path.join(export_dir(model_id, quantized), "config.json"))
+
+def _built_at(path: str) -> float:
+    return os.path.getmtime(os.path.join(path, "config.json"))
+
+def _missing_weights(model_id: str, e: Exception) -> OSError:
+    return OSError(f"weights for {model_id} aren't cached locally ({e}); rerun with --allow-download "
+                   f"or pass --model a local model directory")
+
+def export_onnx(model_id: str, out_dir: Optional[str] = None, local_files_only: bool = True) -> str:
+    """Export `model_id` (encoder, decoder, decoder-with-past) + tokenizer to `out_dir`."""
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    from transformers import AutoTokenizer
+    out_dir = out_dir or export_dir(model_id)
+    tmp = out_dir + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    model = ORTModelForSeq2SeqLM.from_pretrained(model_id, export=True, local_files_only=local_files_only)
+    model.save_pretrained(tmp)
+    AutoTokenizer.from_pretrained(model_id, local_files_only=local_files_only).save_pretrained(tmp)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp, out_dir)  # a half-written export is never picked up
+    if out_dir == export_dir(model_id):
+        # the int8 export was quantized from the old graphs: drop it so it's rebuilt
+        shutil.rmtree(export_dir(model_id, quantized=True), ignore_errors=True)
+    return out_dir
+
+def quantize_onnx(src_dir: str, dst_dir: str) -> str:
+    """Dynamic int8 (weights) quantization of every .onnx graph in `src_dir`; other files are copied."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    tmp = dst_dir + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name in os.listdir(src_dir):
+        src = os.path.join(src_dir, name)
+        if name.endswith(".onnx"):
+            quantize_dynamic(src, os.path.join(tmp, name), weight_type=QuantType.QInt8)
+        elif os.path.isfile(src) and not name.endswith(".onnx_data"):
+            shutil.copy2(src, tmp)
+    shutil.rmtree(dst_dir, ignore_errors=True)
+    os.replace(tmp, dst_dir)
+    return dst_dir
+
+def ensure_export(model_id: str, quantized: bool = QUANTIZE, local_files_only: bool = True) -> str:
+    """
+    Directory of a ready export, creating (and quantizing) it on first use. An int8
+    export older than the fp32 one it came from is quantized again.
+    """
+    fp32_dir = export_dir(model_id)
+    if not export_ready(model_id):
+        export_onnx(model_id, fp32_dir, local_files_only=local_files_only)
+    if not quantized:
+        return fp32_dir
+    int8_dir = export_dir(model_id, quantized=True)
+    if not export_ready(model_id, quantized=True) or _built_at(int8_dir) < _built_at(fp32_dir):
+        quantize_onnx(fp32_dir, int8_dir)
+    return int8_dir
+
+def load_ort_model(path: str):
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    from transformers import AutoTokenizer
+    model = ORTModelForSeq2SeqLM.from_pretrained(path, provider="CPUExecutionProvider")
+    return model, AutoTokenizer.from_pretrained(path)
+
+def load_summarizer(model_id: Optional[str] = None, quantized: bool = QUANTIZE):
+    """
+    transformers summarization pipeline running the existing ONNX export of
+    `model_id` on ONNX Runtime (CPU). Raises ImportError without optimum/onnxruntime,
+    FileNotFoundError when the export hasn't been built (see ensure_export).
+    """
+    from transformers import pipeline
+    from backend.summarizer.extract_actions import SUMMARIZER_MODEL
+    model_id = model_id or SUMMARIZER_MODEL
+    if not export_ready(model_id, quantized):
+        raise FileNotFoundError(f"no ONNX export at {export_dir(model_id, quantized)}; build it with "
+                                f"`python -m backend.summarizer.model_utils export{' --quantize' if quantized else ''}`")
+    model, tokenizer = load_ort_model(export_dir(model_id, quantized))
+    return pipeline("summarization", model=model, tokenizer=tokenizer)
+
+def validate(model_id: str, path: str, texts: List[str] = VALIDATION_TEXTS, max_length: int = 80,
+             local_files_only: bool = True) -> Dict:
+    """
+    Compare the export at `path` with the PyTorch model on `texts`: max |logit|
+    difference for the first decoder step, and greedy summaries (token-level match).
+    Raises FileNotFoundError without the export, OSError without the PyTorch weights.
+    """
+    import numpy as np
+    import torch
+    from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+    if not os.path.exists(os.path.join(path, "config.json")):
+        raise FileNotFoundError(f"no ONNX export at {path}; run the export command first")
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(model_id, local_files_only=local_files_only)
+        ref = AutoModelForSeq2SeqLM.from_pretrained(model_id, local_files_only=local_files_only).eval()
+    except OSError as e:
+        raise _missing_weights(model_id, e) from e
+    ort, _ = load_ort_model(path)
+    start = ref.config.decoder_start_token_id
+    report = {"model": model_id, "export": path, "samples": []}
+    for text in texts:
+        enc = tokenizer(text, return_tensors="pt", truncation=True)
+        dec = torch.full((1, 1), start, dtype=torch.long)
+        with torch.no_grad():
+            ref_logits = ref(**enc, decoder_input_ids=dec).logits.numpy()
+            ref_ids = ref.generate(**enc, max_length=max_length, **GENERATE_OPTIONS)[0].tolist()
+        ort_logits = np.asarray(ort(**enc, decoder_input_ids=dec).logits)
+        ort_ids = ort.generate(**enc, max_length=max_length, **GENERATE_OPTIONS)[0].tolist()
+        same = sum(a == b for a, b in zip(ref_ids, ort_ids))
+        report["samples"].append({
+            "max_abs_logit_diff": float(np.max(np.abs(ref_logits - ort_logits))),
+            "token_match": same / max(len(ref_ids), len(ort_ids)),
+            "identical": ref_ids == ort_ids,
+            "torch": tokenizer.decode(ref_ids, skip_special_tokens=True),
+            "onnx": tokenizer.decode(ort_ids, skip_special_tokens=True),
+        })
+    report["identical"] = all(s["identical"] for s in report["samples"])
+    report["min_token_match"] = min(s["token_match"] for s in report["samples"])
+    return report
+
+def main():
+    from backend.summarizer.extract_actions import SUMMARIZER_MODEL
+    p = argparse.ArgumentParser(description="Export / quantize / validate the ONNX summarizer")
+    p.add_argument("command", choices=["export", "validate"])
+    p.add_argument("--model", default=SUMMARIZER_MODEL, help="Hugging Face model id or local directory")
+    p.add_argument("--quantize", action="store_true", help="also build (or validate) the int8 export")
+    p.add_argument("--allow-download", action="store_true",
+                   help="fetch weights that aren't cached locally (export and validate)")
+    p.add_argument("--validate", action="store_true", help="after export, compare against PyTorch")
+    p.add_argument("--min-token-match", type=float, default=0.9,
+                   help="int8 pass threshold (fp32 exports must match exactly)")
+    args = p.parse_args()
+
+    local_files_only = not args.allow_download
+    if args.command == "export":
+        try:
+            path = ensure_export(args.model, quantized=False, local_files_only=local_files_only)
+        except OSError as e:
+            sys.exit(f"[onnx] {_missing_weights(args.model, e)}")
+        print(f"[onnx] exported {args.model} -> {path}", file=sys.stderr)
+        if args.quantize:
+            path = ensure_export(args.model, quantized=True)
+            print(f"[onnx] quantized -> {path}", file=sys.stderr)
+        if not args.validate:
+            return
+    status = 0
+    paths = [export_dir(args.model)] + ([export_dir(args.model, quantized=True)] if args.quantize else [])
+    for path in paths:
+        try:
+            report = validate(args.model, path, local_files_only=local_files_only)
+        except OSError as e:  # FileNotFoundError included
+            sys.exit(f"[onnx] {e}")
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        quantized = path.endswith("-int8")
+        ok = report["min_token_match"] >= args.min_token_match if quantized else report["identical"]
+        if not ok:
+            status = 1
+            print(f"[onnx] {path}: output differs from PyTorch beyond tolerance", file=sys.stderr)
+    sys.exit(status)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# backend/transcript.py
+"""
+Array-backed transcript: one row per segment, stored as columns instead of dicts.
+
+  starts, ends   float64 arrays (seconds), rows sorted by start
+  speaker_ids    int32 array indexing `speakers` (-1 = no speaker)
+  text           one packed UTF-8 buffer + int64 offsets (row i is text[offsets[i]:offsets[i+1]])
+
+A prefix maximum of the end times makes overlap queries ("what was said between
+t1 and t2") two binary searches plus a scan of the candidates, instead of a pass
+over every segment. Rows convert to and from the usual
+{"speaker", "start", "end", "text"} dicts (other keys are not kept), and
+read()/write() take the same .json/.jsonl files as backend.transcript_io.
+
+Usage:
+    python backend/transcript.py diarized_clean.json 60 120     # segments overlapping 60 s..120 s
+"""
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+class TranscriptBuilder:
+    """Appends segments straight into column buffers; build() returns the Transcript."""
+    def __init__(self):
+        self._starts = array("d")
+        self._ends = array("d")
+        self._speaker_ids = array("i")
+        self._offsets = array("q", [0])
+        self._text = bytearray()
+        self._speakers = {}  # label -> id
+
+    def append(self, seg: Dict):
+        self._starts.append(float(seg["start"]))
+        self._ends.append(float(seg["end"]))
+        speaker = seg.get("speaker")
+        self._speaker_ids.append(-1 if speaker is None else self._speakers.setdefault(speaker, len(self._speakers)))
+        self._text += (seg.get("text") or "").encode("utf-8")
+        self._offsets.append(len(self._text))
+
+    def extend(self, segments: Iterable[Dict]):
+        for seg in segments:
+            self.append(seg)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def build(self, rows=None) -> "Transcript":
+        """The Transcript of every appended segment, or only of the appended rows at `rows`."""
+        starts = np.array(self._starts, dtype=np.float64)
+        ends = np.array(self._ends, dtype=np.float64)
+        speaker_ids = np.array(self._speaker_ids, dtype=np.int32)
+        text, offsets = bytes(self._text), np.array(self._offsets, dtype=np.int64)
+        if rows is not None:
+            rows = np.asarray(rows, dtype=np.int64)
+            text, offsets = _take_text(text, offsets, rows)
+            starts, ends, speaker_ids = starts[rows], ends[rows], speaker_ids[rows]
+        return Transcript(starts, ends, speaker_ids, list(self._speakers), text, offsets)
+
+class Transcript:
+    def __init__(self, starts: np.ndarray, ends: np.ndarray, speaker_ids: np.ndarray, speakers: List,
+                 text: bytes, offsets: np.ndarray):
+        self.speakers = speakers
+        if len(starts) > 1 and np.any(starts[1:] < starts[:-1]):
+            order = np.argsort(starts, kind="stable")
+            text, offsets = _take_text(text, offsets, order)
+            starts, ends, speaker_ids = starts[order], ends[order], speaker_ids[order]
+        self.starts = starts
+        self.ends = ends
+        self.speaker_ids = speaker_ids
+        self._text = text
+        self._offsets = offsets
+        # max_end[i] = max(ends[:i + 1]): everything before the first max_end > t ends by t
+        self._max_end = np.maximum.accumulate(ends) if len(ends) else ends
+
+    # --- conversion -----------------------------------------------------------
+
+    @classmethod
+    def from_segments(cls, segments: Iterable[Dict]) -> "Transcript":
+        """Build from segment dicts (any order, any iterable, e.g. a generator of pipeline batches)."""
+        builder = TranscriptBuilder()
+        builder.extend(segments)
+        return builder.build()
+
+    @classmethod
+    def empty(cls) -> "Transcript":
+        return TranscriptBuilder().build()
+
+    @classmethod
+    def read(cls, path: str) -> "Transcript":
+        """Load a .json list or streamed .jsonl transcript (see backend.transcript_io)."""
+        from backend.transcript_io import is_jsonl, iter_jsonl, read_segments, segment_key
+        if not is_jsonl(path):
+            return cls.from_segments(read_segments(path))
+        # a retried segment's line replaces its earlier (failed) one; keep only the last row per key
+        rows = {}
+        builder = TranscriptBuilder()
+        for seg in iter_jsonl(path):
+            rows[segment_key(seg)] = len(builder)
+            builder.append(seg)
+        return builder.build(None if len(rows) == len(builder) else list(rows.values()))
+
+    def write(self, path: str):
+        from backend.transcript_io import write_segments
+        write_segments(path, self.to_segments())
+
+    def to_segments(self) -> List[Dict]:
+        return list(self)
+
+    # --- rows -----------------------------------------------------------------
+
+    def __len__(self):
+        return len(self.starts)
+
+    def text(self, i: int) -> str:
+        return self._text[self._offsets[i]:self._offsets[i + 1]].decode("utf-8")
+
+    def speaker(self, i: int):
+        sid = self.speaker_ids[i]
+        return None if sid < 0 else self.speakers[sid]
+
+    def __getitem__(self, i: int) -> Dict:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        seg = {"start": float(self.starts[i]), "end": float(self.ends[i]), "text": self.text(i)}
+        speaker = self.speaker(i)
+        return seg if speaker is None else {"speaker": speaker, **seg}
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def take(self, indices) -> "Transcript":
+        """Rows at `indices` as a new Transcript (re-sorted by start if needed)."""
+        indices = np.asarray(indices, dtype=np.int64)
+        text, offsets = _take_text(self._text, self._offsets, indices)
+        return Transcript(self.starts[indices], self.ends[indices], self.speaker_ids[indices],
+                          self.speakers, text, offsets)
+
+    # --- interval queries -------------------------------------------------------
+
+    def overlapping(self, t1: float, t2: float) -> np.ndarray:
+        """Indices (start order) of segments overlapping [t1, t2)."""
+        hi = int(np.searchsorted(self.starts, t2, side="left"))     # rows starting before t2
+        lo = int(np.searchsorted(self._max_end[:hi], t1, side="right"))  # rows before lo all end by t1
+        return lo + np.flatnonzero(self.ends[lo:hi] > t1)
+
+    def between(self, t1: float, t2: float) -> "Transcript":
+        return self.take(self.overlapping(t1, t2))
+
+    def text_between(self, t1: float, t2: float) -> str:
+        return " ".join(t for t in (self.text(i) for i in self.overlapping(t1, t2)) if t)
+
+    @property
+    def nbytes(self) -> int:
+        return (self.starts.nbytes + self.ends.nbytes + self.speaker_ids.nbytes + self._max_end.nbytes
+                + self._offsets.nbytes + len(self._text))
+
+def _take_text(text: bytes, offsets: np.ndarray, indices: np.ndarray):
+    """Packed text buffer + offsets for the rows at `indices`."""
+    lengths = offsets[indices + 1] - offsets[indices]
+    new_offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    return b"".join(text[offsets[i]:offsets[i + 1]] for i in indices), new_offsets
+
+if __name__ == "__main__":
+    import json, sys
+    if len(sys.argv) < 2:
+        print("Usage: python backend/transcript.py transcript.json|.jsonl [t1 t2]")
+        sys.exit(1)
+    t = Transcript.read(sys.argv[1])
+    if len(sys.argv) >= 4:
+        t = t.between(float(sys.argv[2]), float(sys.argv[3]))
+    print(json.dumps(t.to_segments(), indent=2, ensure_ascii=False))
@@ -0,0 +1,177 @@
+# backend/transcript_io.py
+"""
+Streamed transcript output: one JSON object per line (JSONL) plus a checkpoint.
+
+SegmentWriter appends each batch of finished segments to `<out>.jsonl` and
+flushes it to disk, then atomically rewrites `<out>.jsonl.ckpt`:
+
+  {"source": ..., "audio_sha256": ..., "params": {...}, "total": N, "done": n}
+
+With resume=True the writer reopens an existing output, drops a torn last line
+left by a crash, and reports which segments are already done so callers skip
+them. Segments whose text is an "[ASR error ...]" marker are not counted as done
+and are transcribed again; readers keep the last line written for a segment.
+
+With a `meeting` name every written batch is also added to the full-text search
+index (backend.search) as it lands, so long recordings become searchable while
+they are still being transcribed.
+
+read_segments(path) loads either format (.json list or .jsonl) in start order,
+so cleanup and other consumers take the streamed file directly.
+"""
+import json
+import os
+import tempfile
+from typing import Dict, Iterator, List, Optional, Tuple
+
+CHECKPOINT_SUFFIX = ".ckpt"
+
+def segment_key(seg: Dict) -> Tuple[float, float]:
+    return (round(float(seg["start"]), 3), round(float(seg["end"]), 3))
+
+def is_jsonl(path: str) -> bool:
+    return path.endswith(".jsonl")
+
+def iter_jsonl(path: str) -> Iterator[Dict]:
+    """Lines of a JSONL file; a torn (unterminated, unparsable) last line is ignored."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                if line.endswith("\n"):
+                    raise
+                return  # crash mid-write
+
+def read_segments(path: str) -> List[Dict]:
+    """Segments from a .json list or a streamed .jsonl file, sorted by start."""
+    if is_jsonl(path):
+        latest = {}
+        for seg in iter_jsonl(path):
+            latest[segment_key(seg)] = seg  # a retried segment replaces its failed line
+        segs = list(latest.values())
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            segs = json.load(f)
+    segs.sort(key=lambda s: s.get("start", 0))
+    return segs
+
+def write_segments(path: str, segments: List[Dict]):
+    """Write `segments` as a JSON list, or JSONL when `path` ends with .jsonl."""
+    with open(path, "w", encoding="utf-8") as f:
+        if is_jsonl(path):
+            for seg in segments:
+                f.write(json.dumps(seg, ensure_ascii=False) + "\n")
+        else:
+            json.dump(segments, f, ensure_ascii=False, indent=2)
+
+def _atomic_write_json(path: str, value):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(value, f)
+    os.replace(tmp, path)
+
+def _valid_length(path: str) -> int:
+    """Byte length of the complete, parsable lines at the start of `path`."""
+    good = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                if line.strip():
+                    json.loads(line)
+            except ValueError:
+                break
+            good += len(line)
+    return good
+
+class SegmentWriter:
+    """
+    Append-only JSONL writer with a progress checkpoint.
+
+    `source` and `params` identify the run; resuming against a different audio
+    file or different parameters raises ValueError instead of mixing outputs.
+    """
+    def __init__(self, out_path: str, source: str, params: Optional[dict] = None, resume: bool = False,
+                 meeting: Optional[str] = None):
+        from backend.cache import audio_hash
+        from backend import search
+        self.out_path = out_path
+        self.index = search.index if meeting and search.SEARCH_ENABLED else None
+        self.meeting = meeting
+        self.ckpt_path = out_path + CHECKPOINT_SUFFIX
+        self.state = {"source": os.path.abspath(source), "audio_sha256": audio_hash(source),
+                      "params": params or {}, "total": None, "done": 0}
+        self.done = set()
+        mode = "w"
+        if resume and os.path.exists(self.out_path):
+            self._load_previous()
+            mode = "a"
+        self._f = open(self.out_path, mode, encoding="utf-8")
+        if mode == "w":
+            _atomic_write_json(self.ckpt_path, self.state)
+            if self.index is not None:
+                self.index.index_meeting(self.meeting, [])  # a fresh run drops the old postings
+
+    def _load_previous(self):
+        try:
+            with open(self.ckpt_path, "r", encoding="utf-8") as f:
+                prev = json.load(f)
+        except (OSError, ValueError):
+            prev = None
+        if prev is not None:
+            for field in ("audio_sha256", "params"):
+                if prev.get(field) != json.loads(json.dumps(self.state[field])):
+                    raise ValueError(f"cannot resume {self.out_path}: {field} differs from the checkpoint "
+                                     f"(delete it or write to another file)")
+        # drop a torn last line so appends start on a clean line
+        good = _valid_length(self.out_path)
+        if good != os.path.getsize(self.out_path):
+            with open(self.out_path, "r+b") as f:
+                f.truncate(good)
+        for seg in iter_jsonl(self.out_path):
+            key = segment_key(seg)
+            if str(seg.get("text", "")).startswith("[ASR error"):
+                self.done.discard(key)
+            else:
+                self.done.add(key)
+        self.state["done"] = len(self.done)
+
+    def is_done(self, seg: Dict) -> bool:
+        return segment_key(seg) in self.done
+
+    def set_total(self, total: int):
+        self.state["total"] = total
+        _atomic_write_json(self.ckpt_path, self.state)
+
+    def write(self, segments: List[Dict]):
+        """Append one batch, make it durable, then advance the checkpoint."""
+        if not segments:
+            return
+        for seg in segments:
+            self._f.write(json.dumps(seg, ensure_ascii=False) + "\n")
+            if not str(seg.get("text", "")).startswith("[ASR error"):
+                self.done.add(segment_key(seg))
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self.state["done"] = len(self.done)
+        _atomic_write_json(self.ckpt_path, self.state)
+        if self.index is not None:
+            try:
+                self.index.add_segments(self.meeting, segments)
+            except Exception as e:  # the transcript on disk is what matters; reindex later with search.py
+                print(f"[WARN] search index not updated: {e}")
+
+    def close(self):
+        if not self._f.closed:
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# benchmarks/compare_whisper_int8.py
+"""
+Accuracy + speed comparison of Whisper fp32 vs the int8 CPU mode (device "cpu-int8").
+
+For every input (data/samples/meeting1.wav, data/samples/test1.wav and, with
+--long-minutes, the tiled long recording from run_benchmarks.py) it transcribes
+with both variants and reports load time, transcription seconds, real-time
+factor, peak RSS, model size, and the word error rate of the int8 transcript
+against the fp32 one (and against --reference texts, if given).
+
+Usage (from the soniclens/ directory):
+  PYTHONPATH=. python benchmarks/compare_whisper_int8.py --model small --out int8.json
+  PYTHONPATH=. python benchmarks/compare_whisper_int8.py --reference refs.json --max-wer 0.05
+refs.json maps input file names to reference transcripts. Exit code 1 when the
+int8 WER vs fp32 exceeds --max-wer.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from run_benchmarks import SAMPLES, PeakRSS, make_long_recording, wav_duration  # noqa: E402
+
+VARIANTS = (("fp32", "cpu"), ("int8", "cpu-int8"))
+
+def _words(text):
+    return re.sub(r"[^a-z0-9' ]+", " ", text.lower()).split()
+
+def wer(reference, hypothesis):
+    """Word error rate (substitutions + insertions + deletions) / reference words."""
+    ref, hyp = _words(reference), _words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    row = np.arange(len(hyp) + 1)
+    for i, r in enumerate(ref, 1):
+        prev, row = row, np.empty_like(row)
+        row[0] = i
+        sub = prev[:-1] + np.array([r != h for h in hyp], dtype=row.dtype)
+        best = np.minimum(sub, prev[1:] + 1)
+        for j in range(1, len(hyp) + 1):
+            row[j] = min(best[j - 1], row[j - 1] + 1)
+    return float(row[-1]) / len(ref)
+
+def run_variant(model, device, inputs):
+    from backend.asr import asr_whisper
+    from backend.models import registry, estimate_size
+    res = {"device": device}
+    cached = device == asr_whisper.INT8_DEVICE and os.path.exists(asr_whisper._int8_path(model))
+    t = time.perf_counter()
+    m = asr_whisper.load_model(model, device=device)
+    res["load_sec"] = time.perf_counter() - t
+    if device == asr_whisper.INT8_DEVICE:
+        res["load_from_cache"] = cached
+        res["model_mb"] = os.path.getsize(asr_whisper._int8_path(model)) / (1024 * 1024)
+    else:
+        res["model_mb"] = estimate_size(m) / (1024 * 1024)
+    asr_whisper.warmup(model, device=device)
+    res["inputs"] = {}
+    for path in inputs:
+        audio_sec = wav_duration(path)
+        with PeakRSS() as rss:
+            t = time.perf_counter()
+            text = asr_whisper.transcribe_file(path, model_name=model, device=device)
+            elapsed = time.perf_counter() - t
+        res["inputs"][os.path.basename(path)] = {
+            "seconds": elapsed, "rtf": elapsed / audio_sec, "peak_rss_mb": rss.peak / (1024 * 1024), "text": text,
+        }
+    registry.evict(f"whisper:{model}:{device}")  # measure each variant on its own
+    return res
+
+def main():
+    p = argparse.ArgumentParser(description="Whisper fp32 vs int8 (CPU) comparison")
+    p.add_argument("--model", default="small", help="whisper model name")
+    p.add_argument("--long-minutes", type=float, default=0, help="also run a tiled recording this long")
+    p.add_argument("--reference", default=None, help="JSON {file name: reference transcript}")
+    p.add_argument("--max-wer", type=float, default=None, help="fail when int8 WER vs fp32 exceeds this")
+    p.add_argument("--out", default=None, help="write JSON here (default: stdout)")
+    args = p.parse_args()
+
+    refs = {}
+    if args.reference:
+        with open(args.reference, "r", encoding="utf-8") as f:
+            refs = json.load(f)
+
+    import torch
+    report = {"model": args.model, "torch": torch.__version__, "threads": torch.get_num_threads(), "variants": {}}
+    with tempfile.TemporaryDirectory(prefix="soniclens_int8_") as tmp:
+        inputs = list(SAMPLES)
+        if args.long_minutes > 0:
+            inputs.append(make_long_recording(args.long_minutes, tmp))
+        for label, device in VARIANTS:
+            print(f"[int8] {label}", file=sys.stderr)
+            report["variants"][label] = run_variant(args.model, device, inputs)
+
+    status = 0
+    fp32, int8 = report["variants"]["fp32"], report["variants"]["int8"]
+    report["comparison"] = {}
+    for name, a in fp32["inputs"].items():
+        b = int8["inputs"][name]
+        cmp = {"speedup": a["seconds"] / b["seconds"] if b["seconds"] else None,
+               "wer_int8_vs_fp32": wer(a["text"], b["text"])}
+        if name in refs:
+            cmp["wer_fp32"] = wer(refs[name], a["text"])
+            cmp["wer_int8"] = wer(refs[name], b["text"])
+        report["comparison"][name] = cmp
+        if args.max_wer is not None and cmp["wer_int8_vs_fp32"] > args.max_wer:
+            status = 1
+            print(f"[INT8] {name}: WER vs fp32 {cmp['wer_int8_vs_fp32']:.3f} > {args.max_wer}", file=sys.stderr)
+    report["comparison"]["model_size_ratio"] = int8["model_mb"] / fp32["model_mb"] if fp32["model_mb"] else None
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    sys.exit(status)
+
+if __name__ == "__main__":
+    main()
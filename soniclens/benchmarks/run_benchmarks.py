@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# benchmarks/run_benchmarks.py
+"""
+Per-stage speed benchmark for the SonicLens pipeline (CPU friendly).
+
+Runs on data/samples/meeting1.wav, data/samples/test1.wav and a synthetic long
+recording made by tiling both, and times every stage:
+
+  vad        diarize.simple_vad_segments
+  extract    memory-map once + read every segment window (backend.audio.open_audio)
+  whisper_load (reported separately), asr_whisper, asr_vosk
+  cleanup    cleanup.merge_segments (dicts) + cleanup.clean_transcript (Transcript columns)
+  actions    extract_actions.extract_actions_from_text
+
+For each stage it reports seconds, real-time factor (seconds / audio seconds),
+segments/sec and peak RSS during the stage (Linux only). Stages whose dependencies are missing
+are reported as skipped. A small NumPy calibration loop is timed too, and
+comparisons use RTF divided by that number, so a baseline recorded on one CPU
+box is still meaningful on another.
+
+Usage (from the soniclens/ directory):
+  PYTHONPATH=. python benchmarks/run_benchmarks.py --out bench.json
+  PYTHONPATH=. python benchmarks/run_benchmarks.py --save-baseline        # writes benchmarks/baseline.json
+  PYTHONPATH=. python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json --tolerance 0.2
+No baseline is committed (it belongs to the machine it was recorded on): run
+--save-baseline once on a known-good tree before comparing against it.
+Exit code 1 when any stage regressed past the tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLES = [os.path.join(ROOT, "data", "samples", n) for n in ("meeting1.wav", "test1.wav")]
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+class PeakRSS:
+    """
+    Samples /proc/self/statm in a thread to get the peak RSS of one stage (Linux).
+    Elsewhere `peak` stays None: the only portable number, ru_maxrss, is the peak of
+    the whole process so far, not of the stage.
+    """
+    STATM = "/proc/self/statm"
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._page = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+    def _rss(self):
+        with open(self.STATM) as f:
+            return int(f.read().split()[1]) * self._page
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        if os.path.exists(self.STATM):
+            self.peak = self._rss()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self.peak = max(self.peak, self._rss())
+
+def calibrate(repeats=5):
+    """Seconds for a fixed NumPy workload (best of `repeats`); used to normalize RTFs."""
+    rng = np.random.default_rng(0)
+    a = rng.standard_normal((256, 256)).astype(np.float32)
+    x = rng.standard_normal(1 << 18).astype(np.float32)
+    best = float("inf")
+    for _ in range(repeats):
+        t = time.perf_counter()
+        for _ in range(20):
+            a = np.tanh(a @ a.T / 256.0)
+            np.fft.rfft(x)
+        best = min(best, time.perf_counter() - t)
+    return best
+
+def wav_duration(path):
+    with wave.open(path, "rb") as wf:
+        return wf.getnframes() / float(wf.getframerate())
+
+def make_long_recording(minutes, out_dir):
+    """Tile the bundled samples (with short gaps) into a `minutes`-long 16 kHz mono WAV."""
+    pieces = []
+    for p in SAMPLES:
+        with wave.open(p, "rb") as wf:
+            pieces.append(np.frombuffer(wf.readframes(wf.getnframes()), "<i2"))
+    gap = np.zeros(8000, dtype="<i2")
+    unit = np.concatenate([pieces[0], gap, pieces[1], gap])
+    reps = int(np.ceil(minutes * 60 * 16000 / len(unit)))
+    path = os.path.join(out_dir, f"tiled_{minutes:g}min.wav")
+    with wave.open(path, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(16000)
+        for _ in range(reps):
+            wf.writeframes(unit.tobytes())
+    return path
+
+def run_stage(name, fn, audio_sec, n_segments=None):
+    try:
+        with PeakRSS() as rss:
+            t = time.perf_counter()
+            out = fn()
+            elapsed = time.perf_counter() - t
+    except ImportError as e:
+        return {"skipped": f"missing dependency: {e}"}, None
+    except Exception as e:
+        return {"skipped": f"{type(e).__name__}: {e}"}, None
+    res = {
+        "seconds": elapsed,
+        "rtf": elapsed / audio_sec if audio_sec else None,
+        "peak_rss_mb": rss.peak / (1024 * 1024) if rss.peak is not None else None,
+    }
+    if n_segments is not None:
+        res["segments"] = n_segments
+        res["segments_per_sec"] = n_segments / elapsed if elapsed > 0 else None
+    return res, out
+
+def bench_file(path, args):
+    audio_sec = wav_duration(path)
+    stages = {}
+
+    from backend.diarization.diarize import simple_vad_segments
+    stages["vad"], segs = run_stage("vad", lambda: simple_vad_segments(path), audio_sec)
+    if segs is None:
+        return {"audio_sec": audio_sec, "stages": stages}
+    stages["vad"]["segments"] = len(segs)
+    stages["vad"]["segments_per_sec"] = len(segs) / stages["vad"]["seconds"] if stages["vad"]["seconds"] else None
+
+    def extract():
+        from backend.audio import open_audio
+        with open_audio(path) as source:
+            return source.clips(segs, 0.15, 0.15)[:]
+    stages["extract"], clips = run_stage("extract", extract, audio_sec, len(segs))
+
+    texts = None
+    if args.whisper_model and clips is not None:
+        def load_whisper():
+            from backend.asr.asr_whisper import load_model
+            return load_model(args.whisper_model)
+        def asr_whisper():
+            from backend.asr.asr_whisper import transcribe_batch
+            return transcribe_batch(clips, model_name=args.whisper_model, batch_size=args.batch_size)
+        # model load is reported on its own so it doesn't skew the ASR RTF
+        stages["whisper_load"], _ = run_stage("whisper_load", load_whisper, audio_sec)
+        stages["asr_whisper"], texts = run_stage("asr_whisper", asr_whisper, audio_sec, len(segs))
+    else:
+        stages["asr_whisper"] = {"skipped": "disabled or no clips"}
+
+    if args.vosk_model:
+        def asr_vosk():
+            from backend.asr.asr_vosk import get_engine
+            return get_engine(args.vosk_model).transcribe(path)
+        stages["asr_vosk"], _ = run_stage("asr_vosk", asr_vosk, audio_sec)
+    else:
+        stages["asr_vosk"] = {"skipped": "no --vosk-model"}
+
+    if texts is None:
+        texts = ["we will ship the report by friday. okay."] * len(segs)
+    transcript = [dict(s, text=t) for s, t in zip(segs, texts)]
+
+    def cleanup():
+        from backend import cleanup as cleanup_cli
+        from backend.transcript import Transcript
+        cleanup_cli.merge_segments([dict(s) for s in transcript])
+        cleanup_cli.clean_transcript(Transcript.from_segments(transcript))
+    stages["cleanup"], _ = run_stage("cleanup", cleanup, audio_sec, len(segs))
+
+    def actions():
+        from backend.summarizer.extract_actions import extract_actions_from_text
+        return extract_actions_from_text(" ".join(t for t in texts if t))
+    stages["actions"], _ = run_stage("actions", actions, audio_sec)
+    return {"audio_sec": audio_sec, "stages": stages}
+
+def compare(current, baseline, tolerance, min_seconds=0.05):
+    """
+    Regressions where normalized RTF grew by more than `tolerance` (fraction).
+    Stages that took under `min_seconds` in the baseline are too noisy to judge.
+    """
+    regressions = []
+    cal_now = current["machine"]["calibration_sec"]
+    cal_base = baseline["machine"]["calibration_sec"]
+    for name, res in current["results"].items():
+        base = baseline["results"].get(name)
+        if not base:
+            continue
+        for stage, m in res["stages"].items():
+            b = base["stages"].get(stage, {})
+            if "rtf" not in m or not b.get("rtf") or b.get("seconds", 0) < min_seconds:
+                continue
+            now_n = m["rtf"] / cal_now
+            base_n = b["rtf"] / cal_base
+            ratio = now_n / base_n
+            m["vs_baseline"] = ratio
+            if ratio > 1.0 + tolerance:
+                regressions.append({"input": name, "stage": stage, "ratio": ratio})
+    return regressions
+
+def main():
+    p = argparse.ArgumentParser(description="SonicLens per-stage benchmark")
+    p.add_argument("--long-minutes", type=float, default=10, help="length of the synthetic tiled recording (0 = skip)")
+    p.add_argument("--whisper-model", default="tiny", help="whisper model for the ASR stage ('' to skip)")
+    p.add_argument("--vosk-model", default=None, help="VOSK model dir for the Vosk stage")
+    p.add_argument("--batch-size", type=int, default=8)
+    p.add_argument("--out", default=None, help="write JSON here (default: stdout)")
+    p.add_argument("--baseline", default=None, help="compare against this baseline JSON")
+    p.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE, default=None,
+                   help=f"store this run as the baseline (default {DEFAULT_BASELINE})")
+    p.add_argument("--tolerance", type=float, default=0.15, help="allowed normalized RTF growth before failing")
+    p.add_argument("--min-seconds", type=float, default=0.05, help="ignore stages faster than this in the baseline")
+    args = p.parse_args()
+    if args.baseline and not os.path.exists(args.baseline):
+        p.error(f"baseline {args.baseline} not found; record one first with --save-baseline")
+
+    report = {
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "calibration_sec": calibrate(),
+        },
+        "config": {"whisper_model": args.whisper_model, "vosk_model": args.vosk_model,
+                   "batch_size": args.batch_size, "long_minutes": args.long_minutes},
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="soniclens_bench_") as tmp:
+        inputs = list(SAMPLES)
+        if args.long_minutes > 0:
+            inputs.append(make_long_recording(args.long_minutes, tmp))
+        for path in inputs:
+            print(f"[bench] {os.path.basename(path)}", file=sys.stderr)
+            report["results"][os.path.basename(path)] = bench_file(path, args)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance, args.min_seconds)
+        report["regressions"] = regressions
+        if regressions:
+            status = 1
+            for r in regressions:
+                print(f"[REGRESSION] {r['input']} {r['stage']}: {r['ratio']:.2f}x baseline", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"[bench] baseline written to {args.save_baseline}", file=sys.stderr)
+    sys.exit(status)
+
+if __name__ == "__main__":
+    main()
@@ -7,16 +7,14 @@ async function startCamera(){
 }
 startCamera();
 
-// simple polling demo: fetch latest caption from server every 1s
-async function pollCaption(){
-  try {
-    const res = await fetch('http://localhost:8000/latest_caption');
-    if(res.ok){
-      const j = await res.json();
-      overlay.innerText = j.caption || "No caption yet";
-    }
-  } catch(e) {
-    overlay.innerText = "Backend not running";
-  }
-}
-setInterval(pollCaption, 1000);
+// captions are pushed by the backend (Server-Sent Events); EventSource reconnects on its own
+const captions = new EventSource('http://localhost:8000/captions/stream');
+captions.addEventListener('partial', (ev) => {
+  overlay.innerText = JSON.parse(ev.data).text + ' …';
+});
+captions.addEventListener('final', (ev) => {
+  overlay.innerText = JSON.parse(ev.data).text || "No caption yet";
+});
+captions.onerror = () => {
+  overlay.innerText = "Backend not running";
+};
@@ -1,7 +1,10 @@
 #!/bin/bash
-# Placeholder: show commands for converting PyTorch -> ONNX (models vary)
-# Example for a simple PyTorch model:
-# python export_to_onnx.py --model model.pt --output model.onnx
-
-echo "This script is a placeholder. Converting Whisper to ONNX requires model-dependent steps."
-echo "For TFLite conversion, convert ONNX -> TFLite via onnxruntime / tensorflow-onnx and tflite_convert."
+# Export the summarizer to ONNX (encoder / decoder / decoder-with-past + tokenizer) and
+# check that ONNX Runtime gives the same greedy output as the PyTorch model.
+#   bash scripts/convert_to_onnx.sh [MODEL_ID] [--allow-download]
+# Output: ${SONICLENS_ONNX_DIR:-models/onnx}/<model id>/ ; exit code 1 if the outputs differ.
+set -e
+MODEL=${1:-sshleifer/distilbart-cnn-12-6}
+shift || true
+export PYTHONPATH="$(pwd)"
+python -m backend.summarizer.model_utils export --model "$MODEL" --validate "$@"
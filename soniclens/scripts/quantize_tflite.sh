@@ -1,3 +1,13 @@
 #!/bin/bash
-echo "Placeholder quantize script. Example (TensorFlow):"
-echo "tflite_convert --saved_model_dir=saved_model --output_file=model.tflite --optimization=OPTIMIZE_FOR_SIZE"
+# Int8 (dynamic, weight-only) quantization of the ONNX summarizer export, validated against
+# the PyTorch model (token-level agreement of greedy summaries >= MIN_TOKEN_MATCH).
+# Kept under its old name; the mobile client is a web demo, so TFLite output isn't produced.
+#   bash scripts/quantize_tflite.sh [MODEL_ID] [--allow-download]
+# Output: ${SONICLENS_ONNX_DIR:-models/onnx}/<model id>-int8/
+# Serve it with SONICLENS_SUMMARIZER_QUANTIZE=1.
+set -e
+MODEL=${1:-sshleifer/distilbart-cnn-12-6}
+shift || true
+export PYTHONPATH="$(pwd)"
+python -m backend.summarizer.model_utils export --model "$MODEL" --quantize --validate \
+    --min-token-match "${MIN_TOKEN_MATCH:-0.9}" "$@"
@@ -2,7 +2,11 @@
 set -e
 AUDIO=${1:-data/samples/meeting1.wav}
 DEVICE=${WHISPER_DEVICE:-cpu}
+NAME=$(basename "${AUDIO%.*}")
 export PYTHONPATH="$(pwd)"
-python -m backend.diarization.diarize_and_transcribe "$AUDIO" diarized_with_text.json --model small --device "$DEVICE"
-python backend/diarization/cleanup_transcript.py diarized_with_text.json diarized_clean.json
-echo "Wrote diarized_with_text.json and diarized_clean.json"
+# segments are appended to the .jsonl as they finish; RESUME=1 picks up a crashed run of the same recording
+RESUME_FLAG=""
+if [ "${RESUME:-0}" = "1" ]; then RESUME_FLAG="--resume"; fi
+python -m backend.diarization.diarize_and_transcribe "$AUDIO" "${NAME}_with_text.jsonl" --model small --device "$DEVICE" $RESUME_FLAG
+python backend/diarization/cleanup_transcript.py "${NAME}_with_text.jsonl" "${NAME}_clean.json"
+echo "Wrote ${NAME}_with_text.jsonl and ${NAME}_clean.json"